@@ -0,0 +1,81 @@
+"""Compare two bench.run reports: python -m bench.compare baseline.json current.json [--tolerance 0.15]
+
+Exits 1 when any metric of a scenario present in both reports regressed by
+more than the tolerance, so it can gate performance changes.
+"""
+import argparse
+import json
+import sys
+
+# (path in a scenario, True when higher is better)
+METRICS = [
+    ("server.throughput.frames_analyzed_per_s", True),
+    ("server.throughput.frames_rendered_per_s", True),
+    ("video.frames_per_s", True),
+    ("video.frame_gap_ms.p95", False),
+    ("video.first_frame_ms.p95", False),
+    ("stats.latency_ms.p95", False),
+    ("stats.latency_ms.p99", False),
+    ("server.stages_ms.inference.p95", False),
+    ("server.stages_ms.occupancy.p95", False),
+    ("server.stages_ms.overlay.p95", False),
+    ("resources.cpu_percent", False),
+    ("resources.rss_mb_peak", False),
+]
+# Values this small are noise; a change between two of them is never a regression
+FLOOR = 1.0
+
+def scenario_key(scenario):
+    return (scenario["cameras"], scenario["slots"], scenario["video_clients"], scenario["stats_clients"])
+
+def lookup(scenario, path):
+    value = scenario
+    for key in path.split("."):
+        if not isinstance(value, dict) or key not in value:
+            return None
+        value = value[key]
+    return value
+
+def compare(baseline, current, tolerance=0.15):
+    """Rows of (scenario key, metric, old, new, relative change, regressed) and the number of regressions."""
+    old = {scenario_key(s): s for s in baseline["scenarios"]}
+    rows, regressions = [], 0
+    for scenario in current["scenarios"]:
+        key = scenario_key(scenario)
+        if key not in old:
+            continue
+        for path, higher_is_better in METRICS:
+            before, after = lookup(old[key], path), lookup(scenario, path)
+            if before is None or after is None:
+                continue
+            change = (after - before) / before if before else 0.0
+            worse = -change if higher_is_better else change
+            regressed = worse > tolerance and max(abs(before), abs(after)) >= FLOOR
+            regressions += regressed
+            rows.append((key, path, before, after, change, regressed))
+    return rows, regressions
+
+def print_comparison(rows):
+    for (cameras, slots, video_clients, stats_clients), path, before, after, change, regressed in rows:
+        flag = "  REGRESSION" if regressed else ""
+        print(f"{cameras}cam/{slots}slots/{video_clients}v{stats_clients}s  {path:<42} "
+              f"{before:>10} -> {after:<10} {change:+.1%}{flag}")
+    regressions = sum(row[-1] for row in rows)
+    print(f"{len(rows)} metrics compared, {regressions} regressed")
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare two benchmark reports")
+    parser.add_argument("baseline", type=str)
+    parser.add_argument("current", type=str)
+    parser.add_argument("--tolerance", type=float, default=0.15, help="Allowed relative regression")
+    args = parser.parse_args()
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.current) as f:
+        current = json.load(f)
+    rows, regressions = compare(baseline, current, args.tolerance)
+    print_comparison(rows)
+    sys.exit(1 if regressions else 0)
+
+if __name__ == "__main__":
+    main()
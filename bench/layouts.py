@@ -0,0 +1,26 @@
+import math
+
+def grid_slots(count, width, height, margin=0.05, gap=0.15):
+    """`count` synthetic parking slots laid out as a grid over a width x height frame.
+
+    Each slot is a quadrilateral in the same point format as the slot files
+    in data/, inset by `gap` of its cell so neighbours never touch.
+    """
+    if count <= 0:
+        return []
+    x0, y0 = width * margin, height * margin
+    usable_w, usable_h = width - 2 * x0, height - 2 * y0
+    cols = max(1, math.ceil(math.sqrt(count * usable_w / usable_h)))
+    rows = math.ceil(count / cols)
+    cell_w, cell_h = usable_w / cols, usable_h / rows
+    inset_w, inset_h = cell_w * gap / 2, cell_h * gap / 2
+    slots = []
+    for i in range(count):
+        row, col = divmod(i, cols)
+        left = x0 + col * cell_w + inset_w
+        top = y0 + row * cell_h + inset_h
+        right = x0 + (col + 1) * cell_w - inset_w
+        bottom = y0 + (row + 1) * cell_h - inset_h
+        slots.append([[int(left), int(top)], [int(right), int(top)],
+                      [int(right), int(bottom)], [int(left), int(bottom)]])
+    return slots
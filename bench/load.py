@@ -0,0 +1,170 @@
+import asyncio
+import os
+import time
+import numpy as np
+
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK")
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+BOUNDARY = b"--frame\r\n"
+
+def percentiles(values, scale=1000.0):
+    """p50/p95/p99 and max of a list of seconds, in milliseconds."""
+    if not values:
+        return {"count": 0, "p50": None, "p95": None, "p99": None, "max": None}
+    points = np.percentile(np.asarray(values, float) * scale, [50, 95, 99])
+    return {"count": len(values), **{k: round(float(v), 2) for k, v in zip(("p50", "p95", "p99"), points)},
+            "max": round(float(max(values) * scale), 2)}
+
+async def open_get(host, port, path):
+    """Start an HTTP/1.0 GET, so the body arrives unchunked until the server closes; returns (status, reader, writer)."""
+    reader, writer = await asyncio.open_connection(host, port)
+    writer.write(f"GET {path} HTTP/1.0\r\nHost: {host}\r\n\r\n".encode())
+    await writer.drain()
+    head = await reader.readuntil(b"\r\n\r\n")
+    status = int(head.split(b" ", 2)[1])
+    return status, reader, writer
+
+async def video_client(host, port, camera, deadline):
+    """Read one /video_feed until `deadline`: frame count, bytes, time to first frame and frame gaps."""
+    stats = {"frames": 0, "bytes": 0, "first_frame": None, "gaps": [], "errors": 0}
+    started = time.perf_counter()
+    try:
+        status, reader, writer = await open_get(host, port, f"/video_feed?camera={camera}")
+    except OSError:
+        stats["errors"] += 1
+        return stats
+    if status != 200:
+        stats["errors"] += 1
+        writer.close()
+        return stats
+    buffer, last = b"", None
+    try:
+        while time.perf_counter() < deadline:
+            chunk = await asyncio.wait_for(reader.read(1 << 16), max(0.01, deadline - time.perf_counter()))
+            if not chunk:
+                stats["errors"] += 1
+                break
+            stats["bytes"] += len(chunk)
+            buffer += chunk
+            # Each part starts with the boundary; seeing one means the previous frame is complete
+            while True:
+                at = buffer.find(BOUNDARY, 1)
+                if at < 0:
+                    break
+                buffer = buffer[at:]
+                now = time.perf_counter()
+                if stats["first_frame"] is None:
+                    stats["first_frame"] = now - started
+                else:
+                    stats["gaps"].append(now - last)
+                stats["frames"] += 1
+                last = now
+            if len(buffer) > 1 << 24:
+                buffer = buffer[-len(BOUNDARY):]
+    except asyncio.TimeoutError:
+        pass
+    except OSError:
+        stats["errors"] += 1
+    writer.close()
+    return stats
+
+async def stats_client(host, port, interval, deadline):
+    """Poll /stats every `interval` seconds until `deadline`; records each request's latency."""
+    stats = {"requests": 0, "latencies": [], "errors": 0}
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        try:
+            status, reader, writer = await open_get(host, port, "/stats")
+            await reader.read()
+            writer.close()
+            if status == 200:
+                stats["latencies"].append(time.perf_counter() - started)
+            else:
+                stats["errors"] += 1
+        except OSError:
+            stats["errors"] += 1
+        stats["requests"] += 1
+        await asyncio.sleep(max(0.0, interval - (time.perf_counter() - started)))
+    return stats
+
+def process_tree(pid):
+    """`pid` and all of its descendants (e.g. capture processes)."""
+    children = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                stat = f.read()
+        except OSError:
+            continue
+        ppid = int(stat[stat.rfind(")") + 2:].split()[1])
+        children.setdefault(ppid, []).append(int(entry))
+    tree, pending = [], [pid]
+    while pending:
+        current = pending.pop()
+        tree.append(current)
+        pending.extend(children.get(current, []))
+    return tree
+
+def read_usage(pids):
+    """(CPU seconds, resident bytes) summed over `pids`, from /proc."""
+    cpu, rss = 0.0, 0
+    for pid in pids:
+        try:
+            with open(f"/proc/{pid}/stat") as f:
+                fields = f.read().rsplit(")", 1)[1].split()
+            with open(f"/proc/{pid}/statm") as f:
+                resident = int(f.read().split()[1])
+        except (OSError, IndexError):
+            continue
+        cpu += (int(fields[11]) + int(fields[12])) / CLOCK_TICKS
+        rss += resident * PAGE_SIZE
+    return cpu, rss
+
+async def sample_process(pid, deadline, interval=0.5):
+    """CPU utilisation (percent of one core) and RSS of the server's process tree until `deadline`."""
+    samples = []
+    while time.perf_counter() < deadline:
+        cpu, rss = read_usage(process_tree(pid))
+        samples.append((time.perf_counter(), cpu, rss))
+        await asyncio.sleep(interval)
+    if len(samples) < 2:
+        return {"cpu_percent": None, "cpu_percent_peak": None, "rss_mb": None, "rss_mb_peak": None}
+    times, cpu, rss = (np.array(column, float) for column in zip(*samples))
+    usage = np.diff(cpu) / np.maximum(np.diff(times), 1e-9) * 100
+    return {
+        "cpu_percent": round(float((cpu[-1] - cpu[0]) / (times[-1] - times[0]) * 100), 1),
+        "cpu_percent_peak": round(float(usage.max()), 1),
+        "rss_mb": round(float(rss.mean() / 2 ** 20), 1),
+        "rss_mb_peak": round(float(rss.max() / 2 ** 20), 1),
+        "processes": len(process_tree(pid)),
+    }
+
+async def drive(host, port, pid, cameras, video_clients, stats_clients, duration, stats_interval=0.5):
+    """Run the client load for `duration` seconds while sampling the server; returns the client-side results."""
+    deadline = time.perf_counter() + duration
+    videos = [video_client(host, port, cameras[i % len(cameras)], deadline) for i in range(video_clients)]
+    pollers = [stats_client(host, port, stats_interval, deadline) for _ in range(stats_clients)]
+    resources, *results = await asyncio.gather(sample_process(pid, deadline), *videos, *pollers)
+    videos, pollers = results[:video_clients], results[video_clients:]
+
+    frames = sum(v["frames"] for v in videos)
+    return {
+        "video": {
+            "clients": video_clients,
+            "frames_per_s": round(frames / duration, 2),
+            "frames_per_s_per_client": round(frames / duration / video_clients, 2) if video_clients else None,
+            "mbit_per_s": round(sum(v["bytes"] for v in videos) * 8 / duration / 1e6, 2),
+            "first_frame_ms": percentiles([v["first_frame"] for v in videos if v["first_frame"] is not None]),
+            "frame_gap_ms": percentiles([gap for v in videos for gap in v["gaps"]]),
+            "errors": sum(v["errors"] for v in videos),
+        },
+        "stats": {
+            "clients": stats_clients,
+            "requests_per_s": round(sum(p["requests"] for p in pollers) / duration, 2),
+            "latency_ms": percentiles([latency for p in pollers for latency in p["latencies"]]),
+            "errors": sum(p["errors"] for p in pollers),
+        },
+        "resources": resources,
+    }
@@ -0,0 +1,200 @@
+"""Scalability benchmark: N virtual cameras from one clip, synthetic slot layouts, M dashboard clients.
+
+    python -m bench.run --cameras 1,4 --slots 24,240,2400 --video-clients 0,8 --null-model
+    python -m bench.run ... --baseline bench/results/baseline.json
+
+Every combination of --cameras, --slots and --video-clients is one scenario:
+a fresh server runs in a scratch directory with the clip as every camera
+and a grid of synthetic slots, the clients run for --duration seconds after
+--warmup, and the server's process tree is sampled from /proc. The JSON
+report can be compared with an earlier one by bench.compare.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+from datetime import datetime
+import cv2
+from bench.layouts import grid_slots
+from bench.load import drive
+from bench.compare import compare, print_comparison
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HOST = "127.0.0.1"
+# Pipeline stages whose latency percentiles go into the report
+STAGES = ["decode", "motion_gate", "inference", "tracking", "occupancy", "overlay", "encode", "history"]
+
+def int_list(text):
+    return [int(v) for v in text.split(",") if v.strip()]
+
+def free_port():
+    with socket.socket() as s:
+        s.bind((HOST, 0))
+        return s.getsockname()[1]
+
+def get_json(port, path, timeout=5.0):
+    with urllib.request.urlopen(f"http://{HOST}:{port}{path}", timeout=timeout) as response:
+        return json.load(response)
+
+def wait_ready(port, proc, timeout):
+    """Seconds until /ready answers 200; raises if the server exits or `timeout` passes."""
+    started = time.time()
+    while time.time() - started < timeout:
+        if proc.poll() is not None:
+            raise RuntimeError(f"Server exited with code {proc.returncode}")
+        try:
+            get_json(port, "/ready", timeout=1.0)
+            return round(time.time() - started, 2)
+        except (urllib.error.URLError, OSError):
+            time.sleep(0.25)
+    raise TimeoutError(f"Server not ready after {timeout}s")
+
+def prepare_scenario(root, video, cameras, slots):
+    """Lay out a scratch working directory: static files, camera list and a synthetic slot layout."""
+    cap = cv2.VideoCapture(video)
+    width, height = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    cap.release()
+    if not width or not height:
+        raise RuntimeError(f"Could not read {video}")
+    os.makedirs(os.path.join(root, "data"))
+    for name in ("static", "templates"):
+        os.symlink(os.path.join(REPO, name), os.path.join(root, name))
+    with open(os.path.join(root, "data", "slots_bench.json"), "w") as f:
+        json.dump(grid_slots(slots, width, height), f)
+    with open(os.path.join(root, "data", "cameras.json"), "w") as f:
+        json.dump([{"id": i + 1, "source": video, "slots": "data/slots_bench.json"} for i in range(cameras)], f)
+
+def server_summary(before, after, duration):
+    """Pipeline throughput over the measurement window and recent stage latencies from two /debug/perf snapshots."""
+    def stage_count(snapshot, name):
+        return snapshot["stages_ms"].get(name, {}).get("count", 0)
+
+    def counter(snapshot, name):
+        return snapshot["counters"].get(name, 0)
+
+    throughput = {
+        "frames_captured_per_s": (counter(after, "frames_captured") - counter(before, "frames_captured")) / duration,
+        # publish_tracked times occupancy once per analyzed frame; history is recorded once per rendered frame
+        "frames_analyzed_per_s": (stage_count(after, "occupancy") - stage_count(before, "occupancy")) / duration,
+        "frames_rendered_per_s": (stage_count(after, "history") - stage_count(before, "history")) / duration,
+        "inference_batches_per_s": (stage_count(after, "inference") - stage_count(before, "inference")) / duration,
+    }
+    totals = {name: counter(after, name) - counter(before, name)
+              for name in ("frames_dropped", "frames_skipped", "frames_tracked", "frames_cached")}
+    stages = {name: {k: after["stages_ms"][name][k] for k in ("p50", "p95", "p99")}
+              for name in STAGES if name in after["stages_ms"]}
+    return {"throughput": {k: round(v, 2) for k, v in throughput.items()}, "counters": totals,
+            "stages_ms": stages, "backend": (after.get("backend") or {}).get("backend")}
+
+def run_scenario(args, cameras, slots, video_clients):
+    port = free_port()
+    with tempfile.TemporaryDirectory(prefix="parking-bench-") as root:
+        prepare_scenario(root, args.video, cameras, slots)
+        command = [sys.executable, "-m", "bench.serve", "--port", str(port)]
+        if args.null_model:
+            command.append("--null-model")
+        else:
+            command += ["--model", args.model]
+        if args.backend:
+            command += ["--backend", args.backend]
+        if args.capture_processes:
+            command.append("--capture-processes")
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [REPO, os.environ.get("PYTHONPATH")])))
+        env.pop("PARKING_DAEMON", None)
+        with open(os.path.join(root, "server.log"), "w") as log:
+            proc = subprocess.Popen(command, cwd=root, env=env, stdout=log, stderr=subprocess.STDOUT)
+            try:
+                startup = wait_ready(port, proc, args.ready_timeout)
+                time.sleep(args.warmup)
+                before = get_json(port, "/debug/perf")
+                started = time.perf_counter()
+                clients = asyncio.run(drive(HOST, port, proc.pid, list(range(1, cameras + 1)), video_clients,
+                                            args.stats_clients, args.duration, args.stats_interval))
+                after = get_json(port, "/debug/perf")
+                elapsed = time.perf_counter() - started
+            except Exception:
+                with open(os.path.join(root, "server.log")) as f:
+                    print(f.read()[-2000:], file=sys.stderr)
+                raise
+            finally:
+                proc.terminate()
+                try:
+                    proc.wait(15)
+                except subprocess.TimeoutExpired:
+                    proc.kill()
+    return {"cameras": cameras, "slots": slots, "video_clients": video_clients,
+            "stats_clients": args.stats_clients, "startup_s": startup,
+            "server": server_summary(before, after, elapsed), **clients}
+
+def host_info():
+    model = platform.processor()
+    if os.path.exists("/proc/cpuinfo"):
+        with open("/proc/cpuinfo") as f:
+            model = next((line.split(":", 1)[1].strip() for line in f if line.startswith("model name")), model)
+    return {"platform": platform.platform(), "python": platform.python_version(), "cpus": os.cpu_count(),
+            "cpu_model": model, "opencv": cv2.__version__}
+
+def main():
+    parser = argparse.ArgumentParser(description="Parking server scalability benchmark")
+    parser.add_argument("--video", type=str, default=os.path.join(REPO, "uploads", "car-detection.mp4"),
+                        help="Clip every virtual camera plays")
+    parser.add_argument("--cameras", type=int_list, default=[1, 4], help="Comma-separated camera counts")
+    parser.add_argument("--slots", type=int_list, default=[24, 240, 2400],
+                        help="Comma-separated slot counts per camera")
+    parser.add_argument("--video-clients", type=int_list, default=[0, 8],
+                        help="Comma-separated numbers of concurrent /video_feed clients")
+    parser.add_argument("--stats-clients", type=int, default=4, help="Concurrent /stats pollers")
+    parser.add_argument("--stats-interval", type=float, default=0.5, help="Seconds between polls per /stats client")
+    parser.add_argument("--duration", type=float, default=20.0, help="Measured seconds per scenario")
+    parser.add_argument("--warmup", type=float, default=5.0, help="Seconds after /ready before measuring")
+    parser.add_argument("--ready-timeout", type=float, default=300.0)
+    parser.add_argument("--model", type=str, default=os.path.join(REPO, "yolov8s.pt"), help="YOLO weights")
+    parser.add_argument("--backend", type=str, default=None, help="Inference runtime (default: server setting)")
+    parser.add_argument("--null-model", action="store_true",
+                        help="Synthetic detections instead of YOLO: measures everything around inference, offline")
+    parser.add_argument("--capture-processes", action="store_true", help="Decode cameras in separate processes")
+    parser.add_argument("--output", type=str, default=None,
+                        help="Report path (default: bench/results/report-<timestamp>.json)")
+    parser.add_argument("--baseline", type=str, default=None,
+                        help="Compare with this report; exits 1 on a regression beyond --tolerance")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="Allowed relative regression")
+    args = parser.parse_args()
+    args.video = os.path.abspath(args.video)
+    args.model = os.path.abspath(args.model)
+
+    report = {"created": datetime.now().isoformat(timespec="seconds"), "host": host_info(),
+              "config": {k: v for k, v in vars(args).items() if k not in ("output", "baseline")}, "scenarios": []}
+    for cameras, slots, video_clients in itertools.product(args.cameras, args.slots, args.video_clients):
+        print(f"Scenario: {cameras} cameras, {slots} slots, {video_clients} video / "
+              f"{args.stats_clients} stats clients")
+        result = run_scenario(args, cameras, slots, video_clients)
+        report["scenarios"].append(result)
+        server = result["server"]["throughput"]
+        print(f"  analyzed {server['frames_analyzed_per_s']}/s, rendered {server['frames_rendered_per_s']}/s, "
+              f"video {result['video']['frames_per_s']} frames/s, stats p95 {result['stats']['latency_ms']['p95']} ms, "
+              f"CPU {result['resources']['cpu_percent']}%, RSS {result['resources']['rss_mb_peak']} MB")
+
+    output = args.output or os.path.join(REPO, "bench", "results",
+                                         f"report-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Report written to {output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            rows, regressions = compare(json.load(f), report, args.tolerance)
+        print_comparison(rows)
+        sys.exit(1 if regressions else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""Runs server.py for one benchmark scenario, from the scenario directory prepared by bench.run."""
+import argparse
+import time
+from types import SimpleNamespace
+import numpy as np
+import uvicorn
+import server
+
+class NullTensor:
+    def __init__(self, data):
+        self.data = data
+
+    def cpu(self):
+        return self
+
+    def numpy(self):
+        return self.data
+
+class NullModel:
+    """Stands in for YOLO: a grid of car boxes per crop, a few of which come and go on every call.
+
+    Everything after inference (tracking, occupancy, stats, overlay,
+    encoding) still runs on realistic input, without weights or a runtime.
+    """
+
+    def __init__(self, boxes=16, churn=0.1, seed=0):
+        self.boxes = boxes
+        self.churn = churn
+        self.rng = np.random.default_rng(seed)
+        self.present = self.rng.random(boxes) < 0.5
+
+    def __call__(self, crops, **kwargs):
+        results = []
+        cols = int(np.ceil(np.sqrt(self.boxes)))
+        for crop in crops:
+            self.present ^= self.rng.random(self.boxes) < self.churn
+            h, w = crop.shape[:2]
+            cell_w, cell_h = w / cols, h / cols
+            index = np.nonzero(self.present)[0]
+            x1, y1 = (index % cols) * cell_w + cell_w * 0.2, (index // cols) * cell_h + cell_h * 0.2
+            data = np.stack([x1, y1, x1 + cell_w * 0.6, y1 + cell_h * 0.6,
+                             np.full(len(index), 0.9), np.full(len(index), 2.0)], axis=1).astype(np.float32)
+            results.append(SimpleNamespace(boxes=SimpleNamespace(data=NullTensor(data))))
+        return results
+
+def load_null_model(self):
+    self.model = NullModel()
+    self.backend = {"backend": "null", "artifact": None, "int8": False, "imgsz": server.INFERENCE_IMGSZ,
+                    "fps": {"null": 0.0}, "agreement": {}}
+    self.model_digest = "null"
+    self.model_state = "ready"
+    self.ready_after = round(time.time() - self.started, 2)
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark server for one scenario")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--model", type=str, default=None, help="Weights path (default: server.MODEL_PATH)")
+    parser.add_argument("--backend", type=str, default=None, help="Inference runtime (default: server setting)")
+    parser.add_argument("--null-model", action="store_true", help="Replace YOLO with synthetic detections")
+    parser.add_argument("--capture-processes", action="store_true", help="Decode cameras in separate processes")
+    parser.add_argument("--result-cache", action="store_true",
+                        help="Replay cached detections (off: the virtual cameras share one clip)")
+    args = parser.parse_args()
+
+    if args.model:
+        server.MODEL_PATH = args.model
+    if args.backend:
+        server.INFERENCE_BACKEND = args.backend
+    server.CAPTURE_PROCESSES = args.capture_processes
+    if args.null_model:
+        server.ParkingSystem.load_model = load_null_model
+    if not args.result_cache:
+        server.ParkingSystem.result_log = lambda self, camera, index: None
+    uvicorn.run(server.app, host="127.0.0.1", port=args.port, log_level="warning")
+
+if __name__ == "__main__":
+    main()
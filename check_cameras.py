@@ -1,18 +1,43 @@
+import threading
+import time
 import cv2
 
-def check_cameras():
+MAX_INDEX = 5
+PROBE_TIMEOUT = 3.0
+
+def probe(index, results, timeout=PROBE_TIMEOUT):
+    ms = int(timeout * 1000)
+    # Backends that honour these give up on their own; the others are abandoned by the caller
+    cap = cv2.VideoCapture(index, cv2.CAP_ANY, [cv2.CAP_PROP_OPEN_TIMEOUT_MSEC, ms, cv2.CAP_PROP_READ_TIMEOUT_MSEC, ms])
+    if not cap.isOpened():
+        results[index] = "missing"
+    else:
+        ret, _ = cap.read()
+        results[index] = "working" if ret else "no-frames"
+    cap.release()
+
+def check_cameras(max_index=MAX_INDEX, timeout=PROBE_TIMEOUT):
+    """Probe camera indices in parallel; a probe that hangs is reported as timed out."""
     print("Checking for available cameras...")
-    for i in range(5):
-        cap = cv2.VideoCapture(i)
-        if cap.isOpened():
-            ret, frame = cap.read()
-            if ret:
-                print(f"✅ Camera Index {i} is WORKING.")
-            else:
-                print(f"⚠️ Camera Index {i} is detected but cannot read frames.")
-            cap.release()
+    results = {}
+    threads = [threading.Thread(target=probe, args=(i, results, timeout), daemon=True) for i in range(max_index)]
+    for thread in threads:
+        thread.start()
+    deadline = time.time() + timeout
+    for thread in threads:
+        thread.join(max(0.0, deadline - time.time()))
+
+    for i in range(max_index):
+        state = results.get(i, "timeout")
+        if state == "working":
+            print(f"✅ Camera Index {i} is WORKING.")
+        elif state == "no-frames":
+            print(f"⚠️ Camera Index {i} is detected but cannot read frames.")
+        elif state == "timeout":
+            print(f"⌛ Camera Index {i} did not answer within {timeout:.0f}s.")
         else:
             print(f"❌ Camera Index {i} is NOT detected.")
+    return results
 
 if __name__ == "__main__":
     check_cameras()
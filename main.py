@@ -3,17 +3,39 @@ import os
 import sys
 from src.selector import SlotSelector
 from src.detector import ParkingDetector
+from src.batch import run_batch
 
 def main():
     parser = argparse.ArgumentParser(description="Smart Parking Occupancy Detection System")
-    parser.add_argument("--mode", type=str, choices=["select", "detect"], required=True,
-                        help="Mode: 'select' to define slots, 'detect' to run occupancy detection")
+    parser.add_argument("--mode", type=str, choices=["select", "detect", "batch"], required=True,
+                        help="Mode: 'select' to define slots, 'detect' to run occupancy detection, "
+                             "'batch' to process a recorded video headless into an occupancy timeline")
     parser.add_argument("--video", type=str, default="data/parking_video.mp4",
                         help="Path to the video file or camera index")
     parser.add_argument("--slots", type=str, default="data/slots.json",
                         help="Path to save/load parking slots JSON")
     parser.add_argument("--model", type=str, default="yolov8s.pt",
                         help="YOLO model path")
+    parser.add_argument("--no-motion-gate", action="store_true",
+                        help="Run YOLO on every frame instead of skipping static ones")
+    parser.add_argument("--min-overlap", type=float, default=None,
+                        help="Mark a slot occupied when vehicle boxes cover this share of it (default: box centre test)")
+    parser.add_argument("--tile-size", type=int, default=None,
+                        help="Split the slot area into overlapping tiles of this many pixels for inference")
+    parser.add_argument("--imgsz", type=int, default=640,
+                        help="YOLO input size for each crop or tile")
+    parser.add_argument("--backend", type=str, choices=["auto", "openvino", "onnx", "torch"], default="auto",
+                        help="Inference runtime; 'auto' benchmarks the installed ones and keeps the fastest")
+    parser.add_argument("--int8", action="store_true",
+                        help="Use an INT8 export calibrated on frames of --video (ONNX/OpenVINO)")
+    parser.add_argument("--detect-every", type=int, default=1,
+                        help="Run full detection every Nth analyzed frame and track boxes by optical flow in between")
+    parser.add_argument("--stride", type=int, default=1,
+                        help="Batch mode: analyze every Nth frame")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Batch mode: number of worker processes (default: CPU count)")
+    parser.add_argument("--output", type=str, default="data/occupancy_timeline.csv",
+                        help="Batch mode: timeline file to write (.csv or .parquet)")
 
     args = parser.parse_args()
     
@@ -27,8 +49,22 @@ def main():
         selector.run()
     elif args.mode == "detect":
         print(f"Starting Parking Detector on {video_source}...")
-        detector = ParkingDetector(model_path=args.model, slots_path=args.slots)
+        detector = ParkingDetector(model_path=args.model, slots_path=args.slots, min_overlap=args.min_overlap,
+                                   motion_gate=not args.no_motion_gate, tile_size=args.tile_size, imgsz=args.imgsz,
+                                   detect_every=args.detect_every, backend=args.backend, int8=args.int8,
+                                   sources=[video_source])
         detector.detect(video_source)
+    elif args.mode == "batch":
+        if isinstance(video_source, int):
+            print("Error: Batch mode needs a recorded video file, not a camera index.")
+            sys.exit(1)
+        print(f"Starting batch analysis of {video_source}...")
+        report = run_batch(video_source, args.slots, args.model, args.output, stride=args.stride,
+                           workers=args.workers, min_overlap=args.min_overlap,
+                           motion_gate=not args.no_motion_gate, tile_size=args.tile_size, imgsz=args.imgsz,
+                           detect_every=args.detect_every, backend=args.backend, int8=args.int8)
+        if report is None:
+            sys.exit(1)
 
 if __name__ == "__main__":
     main()
@@ -4,16 +4,42 @@ import json
 import os
 import time
 import threading
+import queue
 import asyncio
-import shutil
-from fastapi import FastAPI, Response, Request, UploadFile, File, BackgroundTasks
+import sys
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Response, Request, BackgroundTasks
+from urllib.parse import unquote
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from fastapi.responses import HTMLResponse, StreamingResponse, JSONResponse
-from ultralytics import YOLO
 from datetime import datetime
+from src.slot_index import SlotIndex
+from src.motion import MotionGate
+from src.tracker import BoxTracker
+from src.reader import FrameReader, SampleRate
+from src.overlay import SlotOverlay
+from src.results import ResultCache
+from src.capture import CaptureProcess
+from src.hashing import file_digest, frame_hash, source_digest
+from src.roi import RoiTiler, detect_boxes
+from src.discovery import DiscoveryCache, discover_slots
+from src.broadcaster import FrameBroadcaster, StatsBroadcaster
+from src.history import OccupancyHistory
+from src.metrics import metrics, InstrumentedLock, sample_profile
+from src.uploads import UploadStore, is_partial
+from src.daemon import DaemonServer, RemoteSystem
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app):
+    # Cameras and the model come up in the background so the server answers right away
+    parking_system.start()
+    yield
+    parking_system.stop()
+
+app = FastAPI(lifespan=lifespan)
 
 # Mount static and templates
 app.mount("/static", StaticFiles(directory="static"), name="static")
@@ -21,11 +47,64 @@ templates = Jinja2Templates(directory="templates")
 
 # Configuration
 MODEL_PATH = "yolov8s.pt"
+# "auto" benchmarks every installed runtime (openvino, onnx, torch) at startup and keeps the fastest.
+# Exports are cached next to the weights; INT8 calibrates on frames from the configured videos.
+INFERENCE_BACKEND = "auto"
+INT8 = False
 VIDEO_SLOTS_PATH = "data/slots_video.json"
 WEBCAM_SLOTS_PATH = "data/slots_webcam.json"
 VIDEO_SOURCE = "data/parking_video_1.mp4"
+CAMERAS_CONFIG = "data/cameras.json"
 CONF_THRESHOLD = 0.2
 DETECTION_MODE = "all" 
+FRAME_QUEUE_SIZE = 2
+# COCO vehicle classes: bicycle, car, motorcycle, bus, truck
+VEHICLE_CLASSES = [1, 2, 3, 5, 7]
+# None matches on box centres; a ratio requires that share of the slot to be covered
+MIN_SLOT_OVERLAP = None
+# Motion gating: re-run YOLO only when a slot region changes by this many grey levels,
+# or when the last inference is older than MAX_STALENESS seconds
+MOTION_THRESHOLD = 8.0
+MAX_STALENESS = 5.0
+JPEG_QUALITY = 80
+# Inference runs on the slot area only. TILE_SIZE (source pixels) splits that area into
+# overlapping tiles, each scaled to INFERENCE_IMGSZ; None keeps a single crop.
+TILE_SIZE = None
+INFERENCE_IMGSZ = 640
+# Full YOLO detection every DETECT_EVERY analyzed frames; in between, boxes are carried
+# forward by optical flow. 1 detects on every frame that passes the motion gate.
+DETECT_EVERY = 1
+HISTORY_DIR = "data/history"
+DISCOVERY_CACHE_DIR = "data/discovery_cache"
+# Per-frame detections of video files, replayed when a video loops or is opened again
+RESULTS_DIR = "data/results"
+# Decode each camera in its own process, handing frames over through shared memory without copying,
+# so capture runs on other cores than inference and rendering
+CAPTURE_PROCESSES = False
+UPLOADS_DIR = "uploads"
+# Run the pipeline in one inference daemon (`python server.py --daemon`) and any number of web
+# workers (`PARKING_DAEMON=<socket> uvicorn server:app --workers N`) that relay its frames and stats.
+DAEMON_SOCKET = os.environ.get("PARKING_DAEMON")
+# Shared authentication key; when unset, the daemon generates one into <socket>.key (mode 0600)
+DAEMON_AUTHKEY = os.environ.get("PARKING_DAEMON_KEY", "").encode() or None
+DAEMON_MODE = __name__ == "__main__" and "--daemon" in sys.argv
+
+def put_latest(q, item):
+    """Put item on a bounded queue, dropping the oldest entries when it is full.
+
+    Returns the number of dropped entries.
+    """
+    dropped = 0
+    while True:
+        try:
+            q.put_nowait(item)
+            return dropped
+        except queue.Full:
+            try:
+                q.get_nowait()
+                dropped += 1
+            except queue.Empty:
+                pass
 
 # Global State
 class Camera:
@@ -33,10 +112,114 @@ class Camera:
         self.id = id
         self.source = source
         self.slots_path = slots_path
-        self.cap = cv2.VideoCapture(source)
+        self.lock = InstrumentedLock("camera_lock", metrics)
+        self.generation = 0
+        self.cap = None
+        self.reader = None
+        # Captures replaced by `open`, released by the capture thread
+        self.retired = []
+        # Queues waiting for a copy of the next sampled frame (see read_frame)
+        self.snapshot_requests = []
+        # CaptureProcess decoding this camera when CAPTURE_PROCESSES is on
+        self.process = None
+        # Content digest of a file source, keying its cached detections
+        self.digest = None
+        # ResultLog of the current source and settings, once the pipeline has opened it
+        self.results = None
+        # Frames per second handed to the pipeline, following its measured throughput
+        self.sample_rate = SampleRate()
+        # "pending" until ParkingSystem.start opens the source, then "open" or "failed"
+        self.state = "pending"
         self.slots = self.load_slots()
         self.slot_start_times = [None] * len(self.slots)
         self.occupancy = [False] * len(self.slots)
+        self.capture_queue = queue.Queue(maxsize=FRAME_QUEUE_SIZE)
+        self.slot_index = None
+        self.roi = None
+        # Pending background slot discovery, if any
+        self.discovery = None
+        # (frame hash, slots) discovered on a partial upload, cached once the upload's digest is known
+        self.partial_layout = None
+        self.motion_gate = MotionGate(MOTION_THRESHOLD, MAX_STALENESS)
+        self.tracker = BoxTracker(DETECT_EVERY)
+        # Occupancy from the last real inference, carried forward over skipped frames
+        self.last_occupancy = None
+        self.last_vehicles = []
+        # Track id of the vehicle in each slot, when known
+        self.vehicles = [None] * len(self.slots)
+        self.broadcaster = FrameBroadcaster(JPEG_QUALITY)
+        self.overlay = SlotOverlay()
+        self.stats = self.build_stats(self.occupancy)
+
+    def update_start_times(self, occupancy, vehicles, now):
+        """Track when each slot became occupied. Callers must hold the system lock."""
+        for i, (was, now_occupied) in enumerate(zip(self.occupancy, occupancy)):
+            if now_occupied and not was:
+                self.slot_start_times[i] = now
+            elif was and not now_occupied:
+                self.slot_start_times[i] = None
+            elif (now_occupied and i < len(vehicles) and i < len(self.vehicles) and vehicles[i] is not None
+                  and self.vehicles[i] is not None and vehicles[i] != self.vehicles[i]):
+                # Another vehicle took the slot between two frames
+                self.slot_start_times[i] = now
+
+    def build_stats(self, occupancy):
+        total_slots = len(self.slots)
+        occupied_count = sum(occupancy)
+        now = time.time()
+        durations = [f"{int((now - start) // 60)}m" if start else None for start in self.slot_start_times]
+        return {
+            "camera": self.id,
+            "total": total_slots,
+            "occupied": occupied_count,
+            "vacant": total_slots - occupied_count,
+            "utilization": round((occupied_count / total_slots * 100) if total_slots > 0 else 0, 1),
+            "slots": occupancy,
+            "durations": durations,
+            # Epoch seconds each stay began: stats are only pushed on changes, so clients count durations up
+            "since": [round(start, 1) if start else None for start in self.slot_start_times],
+            "vehicles": self.vehicles,
+            "skip_ratio": self.motion_gate.skip_ratio,
+            "source": "single-view"
+        }
+
+    def open(self, source, resume=False):
+        """Swap the capture source. Frames read before the swap carry an older generation.
+
+        With resume, playback continues at the current frame position (same content, new path).
+        """
+        live = not (isinstance(source, str) and os.path.isfile(source))
+        # A partial upload's content is still changing, so nothing may be cached under its hash
+        digest = None if live or is_partial(source) else source_digest(source)
+        if self.process is not None:
+            with self.lock:
+                self.generation += 1
+                generation = self.generation
+                self.results = None
+            opened, live, fps = self.process.open(source, resume, generation)
+            with self.lock:
+                self.sample_rate.max_rate = fps
+                self.process.rate.value = self.sample_rate.rate
+                self.source = source
+                self.digest = digest
+                self.state = "open" if opened else "failed"
+            return
+
+        cap = cv2.VideoCapture(source)
+        with self.lock:
+            if resume and self.reader is not None and not self.reader.live:
+                cap.set(cv2.CAP_PROP_POS_FRAMES, self.reader.position)
+            if self.cap is not None:
+                # The capture thread may be blocked in grab() on it; it releases the old capture itself
+                self.retired.append(self.cap)
+            self.cap = cap
+            self.reader = FrameReader(cap, live, cap.get(cv2.CAP_PROP_FPS))
+            self.sample_rate.max_rate = self.reader.fps
+            self.source = source
+            self.digest = digest
+            self.generation += 1
+            self.results = None
+            self.state = "open" if cap.isOpened() else "failed"
 
     def load_slots(self):
         if os.path.exists(self.slots_path):
@@ -52,206 +235,576 @@ class Camera:
 
     def auto_discover_slots(self, frame):
         """Dynamic slot discovery using orientation-aware line analysis."""
-        print(f"DEBUG: Analyzing orientation for new source...")
-        h, w = frame.shape[:2]
-        
-        # 1. Image Processing
-        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        blur = cv2.GaussianBlur(gray, (5, 5), 0)
-        edges = cv2.Canny(blur, 50, 150)
-        lines = cv2.HoughLinesP(edges, 1, np.pi/180, 50, minLineLength=80, maxLineGap=20)
-        
-        detected_slots = []
-        if lines is not None:
-            # Check for dominant orientation (Vertical vs Horizontal)
-            vert_lines = []
-            horiz_lines = []
-            for line in lines:
-                x1, y1, x2, y2 = line[0]
-                if abs(x1 - x2) < abs(y1 - y2): # Vertical
-                    vert_lines.append(line[0])
-                else: # Horizontal
-                    horiz_lines.append(line[0])
-
-            # Logic for Vertical Slots (like the bus lot)
-            if len(vert_lines) > len(horiz_lines):
-                print("DEBUG: Vertical Slot layout detected.")
-                x_coords = sorted([l[0] for l in vert_lines] + [l[2] for l in vert_lines])
-                cols = []
-                if x_coords:
-                    curr_x = x_coords[0]
-                    cols.append(curr_x)
-                    for x in x_coords:
-                        if x > curr_x + 35: 
-                            cols.append(x)
-                            curr_x = x
-                
-                row_h = h // 2.5
-                for r_idx in range(2):
-                    y_start = int(h * 0.1) + (r_idx * int(row_h * 1.2))
-                    for i in range(len(cols) - 1):
-                        x1, x2 = cols[i], cols[i+1]
-                        if x2 - x1 > 80: continue 
-                        detected_slots.append([[x1, y_start], [x2, y_start], [x2, y_start + int(row_h)], [x1, y_start + int(row_h)]])
-            
-            # Logic for Horizontal/Angled Slots
-            else:
-                print("DEBUG: Horizontal/Angled layout detected.")
-                y_coords = sorted([l[1] for l in horiz_lines] + [l[3] for l in horiz_lines])
-                rows = []
-                if y_coords:
-                    curr_y = y_coords[0]
-                    rows.append(curr_y)
-                    for y in y_coords:
-                        if y > curr_y + 100:
-                            rows.append(y)
-                            curr_y = y
-                
-                for ry in rows[:4]:
-                    if ry > h * 0.8: continue
-                    count = 12
-                    sw = (w - 150) // count
-                    slant = 20 if ry < h/2 else 40
-                    for i in range(count):
-                        x = 100 + (i * sw)
-                        detected_slots.append([[x, ry], [x + sw - 10, ry], [x + sw - 10 + slant, ry + 70], [x + slant, ry + 70]])
-
-        # Fallback grid if detection is sparse
-        if len(detected_slots) < 8:
-            print("DEBUG: Insufficient cues. Using balanced grid.")
-            for r in range(2):
-                y = int(h * (0.2 + (r * 0.4)))
-                for c in range(12):
-                    x = 60 + (c * (w-120)//12)
-                    detected_slots.append([[x, y], [x + (w-120)//13, y], [x + (w-120)//13, y + int(h*0.3)], [x, y + int(h*0.3)]])
-
-        print(f"DEBUG: Success. {len(detected_slots)} slots accurately mapped.")
-        return detected_slots
+        return discover_slots(frame)
+
+    @property
+    def live(self):
+        if self.process is not None:
+            return self.process.live
+        return self.reader is not None and self.reader.live
+
+    @property
+    def skipped(self):
+        """Source frames passed over without analysis."""
+        if self.process is not None:
+            return self.process.skipped
+        return self.reader.skipped if self.reader else 0
+
+    def current_reader(self):
+        """Capture thread: (generation, reader) to use now, releasing captures that `open` replaced.
+
+        Only the capture thread touches a VideoCapture, and never under the
+        lock: grab() on a stalled stream blocks until FFmpeg's timeout, and
+        `open` or the endpoints must not wait for that. Frames read from a
+        reader that was replaced meanwhile carry its older generation.
+        """
+        with self.lock:
+            retired, self.retired = self.retired, []
+            generation, reader = self.generation, self.reader
+        for cap in retired:
+            cap.release()
+        if reader is None or not reader.cap.isOpened():
+            return generation, None
+        return generation, reader
+
+    def drain(self):
+        """Capture thread, live sources: discard the next buffered frame undecoded. False when the source failed."""
+        _, reader = self.current_reader()
+        return reader is not None and reader.drain()
+
+    def read_indexed(self):
+        """Capture thread: returns (generation, frame index, frame); the index is None for live sources."""
+        generation, reader = self.current_reader()
+        if reader is None:
+            return generation, None, None
+        # Land on frames with cached detections where there is one close to real time
+        results = self.results
+        frame = reader.sample(snap=results.nearest if results is not None else None)
+        if frame is not None and self.snapshot_requests:
+            with self.lock:
+                requests, self.snapshot_requests = self.snapshot_requests, []
+            for request in requests:
+                request.put((generation, frame.copy()))
+        return generation, reader.index, frame
+
+    def read_frame(self, timeout=2.0):
+        """Returns (generation, frame) so callers can drop frames from a replaced source.
+
+        The frame is a copy of the next one the capture thread samples; frame
+        is None if none arrives within `timeout`.
+        """
+        if self.process is not None:
+            generation, _, frame = self.process.latest() or (self.generation, None, None)
+            return generation, frame
+        request = queue.Queue(maxsize=1)
+        with self.lock:
+            self.snapshot_requests.append(request)
+        try:
+            return request.get(timeout=timeout)
+        except queue.Empty:
+            with self.lock:
+                if request in self.snapshot_requests:
+                    self.snapshot_requests.remove(request)
+            return self.generation, None
 
     def get_frame(self):
-        if self.cap and self.cap.isOpened():
-            ret, frame = self.cap.read()
-            if not ret:
-                self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
-                return self.get_frame()
-            return frame
-        return None
+        return self.read_frame()[1]
+
+def check_camera_ids(configs, path):
+    # History stores camera ids in a uint16 column and the history endpoints take them as integers
+    seen = set()
+    for c in configs:
+        camera_id = c.get("id")
+        if type(camera_id) is not int or not 0 <= camera_id <= 65535:
+            raise ValueError(f"{path}: camera id {camera_id!r} must be an integer from 0 to 65535")
+        if camera_id in seen:
+            raise ValueError(f"{path}: duplicate camera id {camera_id}")
+        seen.add(camera_id)
+
+def load_camera_configs(path=CAMERAS_CONFIG):
+    """Reads the camera list; falls back to the single default video camera."""
+    if os.path.exists(path):
+        with open(path, 'r') as f:
+            try:
+                configs = json.load(f)
+            except:
+                print(f"WARNING: Could not parse {path}. Using the default camera.")
+                configs = None
+        if configs:
+            check_camera_ids(configs, path)
+            return configs
+    return [{"id": 1, "source": VIDEO_SOURCE, "slots": "data/slots_video_1.json"}]
 
 class ParkingSystem:
-    def __init__(self):
-        self.model = YOLO(MODEL_PATH)
-        self.camera = Camera(1, VIDEO_SOURCE, "data/slots_video_1.json")
-        self.lock = threading.Lock()
-        self.latest_frame = None
+    """Construction is cheap; `start` opens the cameras and loads the model in the background."""
+
+    def __init__(self, camera_configs=None):
+        if camera_configs is None:
+            camera_configs = load_camera_configs()
+        self.cameras = [Camera(c["id"], c["source"], c["slots"]) for c in camera_configs]
+        # Set once the model has loaded; until then frames are streamed without detection
+        self.model = None
+        self.backend = None
+        self.model_state = "pending"
+        self.model_error = None
+        self.started = None
+        self.ready_after = None
+        # Guards only the swap of shared state; no I/O or inference runs under it
+        self.lock = InstrumentedLock("state_lock", metrics)
         self.stats = self.get_initial_stats()
+        self.stats_broadcaster = StatsBroadcaster()
+        self.stats_broadcaster.publish(self.stats)
+        self.history = OccupancyHistory(HISTORY_DIR)
+        self.discovery_cache = DiscoveryCache(DISCOVERY_CACHE_DIR)
+        self.result_cache = ResultCache(RESULTS_DIR)
+        self.model_digest = None
+        # Slot discovery runs off the frame path so cameras keep streaming meanwhile
+        self.discovery_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="discovery")
+        self.running = False
+        # Set by any capture thread so the inference stage can batch whatever is ready
+        self.frame_ready = threading.Event()
+        self.render_queue = queue.Queue(maxsize=FRAME_QUEUE_SIZE * len(self.cameras))
+        self.threads = []
+        # Stage name -> last error an iteration raised; the stage itself carries on
+        self.stage_errors = {}
+
+    def start(self):
+        """Start the pipeline. Returns immediately; progress is reported by `readiness`."""
+        if self.running:
+            return
         self.running = True
-        self.thread = threading.Thread(target=self.update_loop, daemon=True)
-        self.thread.start()
+        self.started = time.time()
+        self.register_gauges()
+        self.spawn(self.inference_loop, "inference")
+        self.spawn(self.render_loop, "render")
+        # Each camera starts capturing as soon as its own source is open, independent of slow ones
+        for camera in self.cameras:
+            self.spawn(self.open_camera, f"open-{camera.id}", camera)
+        self.spawn(self.load_model, "model-loader")
+
+    def stop(self):
+        self.running = False
+        for camera in self.cameras:
+            if camera.process is not None:
+                camera.process.stop()
+        self.history.flush()
+        self.result_cache.flush()
+
+    def stage_failed(self, stage, error):
+        """Log and count an exception from one iteration of a pipeline stage, which then moves on."""
+        metrics.incr("stage_errors")
+        self.stage_errors[stage] = f"{type(error).__name__}: {error}"
+        print(f"ERROR: {stage} stage failed: {error}")
+        traceback.print_exc()
+        # A persistent fault (e.g. a full disk) should not turn the stage into a busy loop
+        time.sleep(0.5)
+
+    def spawn(self, target, name, *args):
+        thread = threading.Thread(target=target, args=args, name=name, daemon=True)
+        self.threads.append(thread)
+        thread.start()
+
+    def open_camera(self, camera):
+        if CAPTURE_PROCESSES:
+            camera.process = CaptureProcess(f"capture-{camera.id}")
+            self.spawn(self.ring_loop, f"ring-{camera.id}", camera)
+        with metrics.timer("camera_open"):
+            camera.open(camera.source)
+        print(f"DEBUG: Cam {camera.id} {camera.state}: {camera.source}")
+        if camera.process is None:
+            self.capture_loop(camera)
+
+    def load_model(self):
+        self.model_state = "loading"
+        try:
+            # Importing torch and ultralytics alone takes seconds, so it stays off the import path
+            from src.backends import load_backend
+            with metrics.timer("model_load"):
+                model, backend = load_backend(MODEL_PATH, INFERENCE_BACKEND, INFERENCE_IMGSZ, INT8,
+                                              sources=[c.source for c in self.cameras])
+        except Exception as e:
+            self.model_state = "failed"
+            self.model_error = str(e)
+            print(f"ERROR: Could not load the model: {e}")
+            return
+        # The pipeline starts detecting once `model` is set, so everything the result cache keys on comes first
+        self.model_digest = file_digest(MODEL_PATH) if os.path.isfile(MODEL_PATH) else MODEL_PATH
+        self.backend = backend
+        self.model = model
+        self.model_state = "ready"
+        self.ready_after = round(time.time() - self.started, 2)
+        print(f"DEBUG: Inference ready after {self.ready_after}s")
+
+    def readiness(self):
+        cameras = {str(c.id): c.state for c in self.cameras}
+        stages = {t.name: t.is_alive() for t in self.threads if t.name in ("inference", "render")}
+        return {
+            "ready": (self.model_state == "ready" and all(state != "pending" for state in cameras.values())
+                      and all(stages.values())),
+            "model": self.model_state,
+            "backend": self.backend["backend"] if self.backend else None,
+            "error": self.model_error,
+            "cameras": cameras,
+            "stages": stages,
+            "stage_errors": dict(self.stage_errors),
+            "uptime": round(time.time() - self.started, 2) if self.started else 0.0,
+            "ready_after": self.ready_after,
+        }
+
+    def describe_cameras(self):
+        return [{"id": c.id, "source": str(c.source), "slots": len(c.slots), "live": c.live,
+                 "sample_rate": round(c.sample_rate.rate, 1)} for c in self.cameras]
+
+    def metrics_text(self):
+        return metrics.prometheus()
+
+    def metrics_snapshot(self):
+        return {**metrics.snapshot(), "backend": self.backend}
+
+    def profile(self, seconds):
+        return sample_profile(seconds)
+
+    def register_gauges(self):
+        metrics.gauge("capture_queue_depth", lambda: sum(c.capture_queue.qsize() for c in self.cameras))
+        metrics.gauge("render_queue_depth", self.render_queue.qsize)
+        metrics.gauge("video_subscribers", lambda: sum(c.broadcaster.subscribers for c in self.cameras))
+        metrics.gauge("stats_subscribers", lambda: self.stats_broadcaster.subscribers)
+        metrics.gauge("skip_ratio", lambda: self.stats["skip_ratio"])
+        metrics.gauge("source_frames_skipped", lambda: sum(c.skipped for c in self.cameras))
+        metrics.gauge("result_cache_frames", self.result_cache.frames)
+        metrics.gauge("backend_fps", lambda: self.backend["fps"][self.backend["backend"]])
+
+    @property
+    def camera(self):
+        """The primary camera, used by the single-view endpoints."""
+        return self.cameras[0]
+
+    def get_camera(self, camera_id=None):
+        if camera_id is None:
+            return self.camera
+        for camera in self.cameras:
+            if str(camera.id) == str(camera_id):
+                return camera
+        return None
 
     def get_initial_stats(self):
-        total_slots = len(self.camera.slots)
+        return self.build_site_stats()
+
+    def build_site_stats(self):
+        """Aggregate the per-camera stats into whole-site totals. Callers must hold self.lock."""
+        total_slots = sum(c.stats["total"] for c in self.cameras)
+        occupied_count = sum(c.stats["occupied"] for c in self.cameras)
+        slots = []
+        durations = []
+        since = []
+        vehicles = []
+        for c in self.cameras:
+            slots.extend(c.stats["slots"])
+            durations.extend(c.stats["durations"])
+            since.extend(c.stats["since"])
+            vehicles.extend(c.stats["vehicles"])
         return {
             "total": total_slots,
-            "occupied": 0,
-            "vacant": total_slots,
-            "utilization": 0,
-            "slots": [], 
-            "durations": [], 
-            "source": "single-view"
+            "occupied": occupied_count,
+            "vacant": total_slots - occupied_count,
+            "utilization": round((occupied_count / total_slots * 100) if total_slots > 0 else 0, 1),
+            "slots": slots,
+            "durations": durations,
+            "since": since,
+            "vehicles": vehicles,
+            "skip_ratio": round(sum(c.motion_gate.skipped for c in self.cameras) /
+                                max(1, sum(c.motion_gate.checked for c in self.cameras)), 3),
+            "source": "single-view" if len(self.cameras) == 1 else "multi-view",
+            "cameras": {str(c.id): c.stats for c in self.cameras}
         }
 
-    def switch_video(self, video_path):
-        with self.lock:
-            self.camera.cap.release()
-            self.camera.source = video_path
-            self.camera.cap = cv2.VideoCapture(video_path)
-            self.camera.slots = [] # Auto-detect for new video
-            self.camera.occupancy = []
-            self.camera.slot_start_times = []
-            print(f"DEBUG: Switched to source: {video_path}")
-
-    def update_settings(self, sensitivity: float):
-        global CONF_THRESHOLD
+    def set_slots(self, camera, slots):
+        """Replace a camera's slot layout. Callers must hold self.lock."""
+        camera.slots = slots
+        camera.occupancy = [False] * len(slots)
+        camera.vehicles = [None] * len(slots)
+        camera.slot_start_times = [None] * len(slots)
+        camera.stats = camera.build_stats(camera.occupancy)
+        self.stats = self.build_site_stats()
+        self.stats_broadcaster.publish(self.stats)
+
+    def switch_video(self, video_path, camera_id=None, resume=False):
+        camera = self.get_camera(camera_id)
+        camera.open(video_path, resume)
+        if resume:
+            # Same content under a new path: keep slots and playback position
+            if camera.partial_layout is not None and camera.digest is not None:
+                self.discovery_cache.store(camera.digest, *camera.partial_layout)
+            camera.partial_layout = None
+            return
+        camera.partial_layout = None
+        camera.motion_gate.reset()
+        camera.tracker.reset()
         with self.lock:
-            CONF_THRESHOLD = sensitivity
+            self.set_slots(camera, []) # Auto-detect for new video
+        print(f"DEBUG: Cam {camera.id} switched to source: {video_path}")
+
+    def update_settings(self, sensitivity: float, detect_every: int = None):
+        global CONF_THRESHOLD, DETECT_EVERY
+        CONF_THRESHOLD = sensitivity
+        if detect_every is not None:
+            DETECT_EVERY = max(1, int(detect_every))
+            for camera in self.cameras:
+                camera.tracker.detect_every = DETECT_EVERY
+
+    def run_auto_discovery(self, camera_id=None, refresh=False):
+        """Start slot discovery for a camera in the background. Returns False if no frame is available."""
+        camera = self.get_camera(camera_id)
+        generation, frame = camera.read_frame()
+        if frame is None:
+            return False
+        self.request_discovery(camera, generation, frame, replace=True, refresh=refresh)
+        return True
+
+    def request_discovery(self, camera, generation, frame, replace=False, refresh=False):
+        if camera.discovery is not None and not camera.discovery.done():
+            return
+        camera.discovery = self.discovery_pool.submit(self.discover, camera, generation, frame, replace, refresh)
 
-    def run_auto_discovery(self):
+    def discover(self, camera, generation, frame, replace, refresh):
+        partial = is_partial(camera.source)
+        with metrics.timer("discovery"):
+            slots = self.discovery_cache.discover(camera.digest, frame, refresh, cache=not partial)
         with self.lock:
-            frame = self.camera.get_frame()
-            if frame is not None:
-                self.camera.slots = self.camera.auto_discover_slots(frame)
-                self.camera.occupancy = [False] * len(self.camera.slots)
-                self.camera.slot_start_times = [None] * len(self.camera.slots)
+            # Ignore layouts for a replaced source; automatic runs never override existing slots
+            if generation == camera.generation and (replace or not camera.slots):
+                self.set_slots(camera, slots)
+                if partial:
+                    camera.partial_layout = (frame_hash(frame), slots)
 
-    def update_loop(self):
+    def capture_loop(self, camera):
+        """Stage 1: sample the newest frame at the camera's adaptive rate and hand it to inference."""
+        next_sample = 0
         while self.running:
-            with self.lock:
-                frame = self.camera.get_frame()
+            try:
+                if camera.live:
+                    # grab() blocks until the source delivers, so draining keeps pace with the stream
+                    if not camera.drain():
+                        time.sleep(1)
+                        continue
+                    if time.time() < next_sample:
+                        continue
+                else:
+                    delay = next_sample - time.time()
+                    if delay > 0:
+                        time.sleep(delay)
+
+                started = time.time()
+                with metrics.timer("decode"):
+                    generation, index, frame = camera.read_indexed()
                 if frame is None:
                     time.sleep(1)
                     continue
+                metrics.incr("frames_captured")
+                metrics.incr("frames_dropped", put_latest(camera.capture_queue, (generation, index, frame)))
+                self.frame_ready.set()
+                next_sample = started + 1.0 / camera.sample_rate.rate
+            except Exception as e:
+                self.stage_failed(f"capture-{camera.id}", e)
+
+    def ring_loop(self, camera):
+        """Stage 1 with CAPTURE_PROCESSES: pass the frames a capture process decodes on to inference.
 
-                # Auto-discover if slots are missing
-                if not self.camera.slots:
-                    self.camera.slots = self.camera.auto_discover_slots(frame)
-                    self.camera.occupancy = [False] * len(self.camera.slots)
-                    self.camera.slot_start_times = [None] * len(self.camera.slots)
-
-                # Inference
-                results = self.model(frame, verbose=False, conf=CONF_THRESHOLD)
-                
-                # Reset occupancy
-                self.camera.occupancy = [False] * len(self.camera.slots)
-                
-                # Check occupancy
-                for result in results:
-                    boxes = result.boxes
-                    for box in boxes:
-                        cls = int(box.cls[0])
-                        # Filter for vehicles in COCO (cars, buses, trucks, etc.)
-                        if cls in [2, 3, 5, 7, 1]: 
-                            xyxy = box.xyxy[0].cpu().numpy()
-                            # Midpoint of box
-                            cx = int((xyxy[0] + xyxy[2]) / 2)
-                            cy = int((xyxy[1] + xyxy[3]) / 2)
-                            
-                            # Check which slot contains this point
-                            for i, slot in enumerate(self.camera.slots):
-                                poly = np.array(slot, np.int32)
-                                if cv2.pointPolygonTest(poly, (cx, cy), False) >= 0:
-                                    self.camera.occupancy[i] = True
-                
-                # Update stats
-                occupied_count = sum(self.camera.occupancy)
-                total_slots = len(self.camera.slots)
-                
-                # Visuals
-                for i, slot in enumerate(self.camera.slots):
-                    color = (0, 0, 255) if self.camera.occupancy[i] else (0, 255, 0)
-                    poly = np.array(slot, np.int32)
-                    cv2.polylines(frame, [poly], True, color, 2)
-                    
-                    # Show Slot ID
-                    cv2.putText(frame, str(i+1), (int(poly[0][0]), int(poly[0][1] - 5)), 
-                                cv2.FONT_HERSHEY_SIMPLEX, 0.4, color, 1)
-
-                # Encode and update latest frame
-                _, buffer = cv2.imencode('.jpg', frame)
-                self.latest_frame = buffer.tobytes()
-
-                # Metrics update
-                self.stats = {
-                    "total": total_slots,
-                    "occupied": occupied_count,
-                    "vacant": total_slots - occupied_count,
-                    "utilization": round((occupied_count / total_slots * 100) if total_slots > 0 else 0, 1),
-                    "slots": self.camera.occupancy,
-                    "source": "single-view"
-                }
-
-            time.sleep(0.01)
-
-parking_system = ParkingSystem()
+        Frames are views into the shared ring, not copies; the capture process
+        follows the camera's adaptive rate through a shared value.
+        """
+        for generation, index, frame in camera.process.frames():
+            if not self.running:
+                break
+            metrics.incr("frames_captured")
+            metrics.incr("frames_dropped", put_latest(camera.capture_queue, (generation, index, frame)))
+            self.frame_ready.set()
+            camera.process.rate.value = camera.sample_rate.rate
+
+    def collect_batch(self):
+        """Take the newest pending frame from every camera that has one."""
+        batch = []
+        for camera in self.cameras:
+            item = None
+            while True:
+                try:
+                    newer = camera.capture_queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is not None:
+                    metrics.incr("frames_dropped")
+                item = newer
+            if item is not None:
+                batch.append((camera, *item))
+        return batch
+
+    def ensure_slots(self, camera, generation, frame):
+        """Returns the camera's slots, starting background discovery if there are none yet."""
+        with self.lock:
+            slots = camera.slots
+        if not slots:
+            self.request_discovery(camera, generation, frame)
+        return slots
+
+    def inference_loop(self):
+        """Stage 2: run YOLO once per tick over the latest frame of every camera."""
+        while self.running:
+            if not self.frame_ready.wait(timeout=0.5):
+                continue
+            self.frame_ready.clear()
+            collected = self.collect_batch()
+            started = time.perf_counter()
+            try:
+                self.process_batch(collected)
+            except Exception as e:
+                self.stage_failed("inference", e)
+                continue
+            # Sampling follows how long the pipeline needs per frame
+            elapsed = time.perf_counter() - started
+            for camera, _, _, _ in collected:
+                camera.sample_rate.observe(elapsed)
+
+    def process_batch(self, collected):
+        """Gate, track or detect the newest frame of each camera; detections share one model call."""
+        batch = []
+        for camera, generation, index, frame in collected:
+            slots = self.ensure_slots(camera, generation, frame)
+            if not slots:
+                # Keep streaming raw frames until discovery delivers a layout
+                put_latest(self.render_queue, (camera, generation, frame, slots, [], []))
+                continue
+            if self.model is None:
+                # Still loading: stream the frame without touching the stats
+                put_latest(self.render_queue, (camera, generation, frame, slots, None, None))
+                continue
+            camera.slot_index = SlotIndex.ensure(camera.slot_index, slots, frame.shape)
+            camera.roi = RoiTiler.ensure(camera.roi, slots, frame.shape, TILE_SIZE)
+
+            # A looping or reopened video replays the detections of the same frame
+            results = self.result_log(camera, index)
+            camera.results = results
+            cached = results.get(index) if results is not None else None
+            if cached is not None:
+                with metrics.timer("tracking"):
+                    self.publish_tracked(camera, generation, frame, slots, camera.tracker.update(frame, cached))
+                metrics.incr("frames_cached")
+                continue
+
+            # Static slots keep their previous occupancy without a YOLO pass
+            stale = camera.last_occupancy is None or len(camera.last_occupancy) != len(slots)
+            with metrics.timer("motion_gate"):
+                infer = camera.motion_gate.should_infer(frame, camera.slot_index, force=stale)
+            if not infer:
+                metrics.incr("frames_skipped")
+                metrics.incr("frames_dropped", put_latest(self.render_queue, (
+                    camera, generation, frame, slots, camera.last_occupancy, camera.last_vehicles)))
+                continue
+
+            # Between full detections, boxes are carried forward by optical flow
+            if not camera.tracker.due(camera.motion_gate.changed, None if stale else camera.last_occupancy):
+                with metrics.timer("tracking"):
+                    boxes = camera.tracker.propagate(frame)
+                    self.publish_tracked(camera, generation, frame, slots, boxes)
+                metrics.incr("frames_tracked")
+                continue
+            batch.append((camera, generation, frame, slots, results, index))
+        if not batch:
+            return
+
+        # Inference on the slot-area crops of every camera in one batch
+        with metrics.timer("inference"):
+            detections = detect_boxes(self.model, [item[2] for item in batch], [item[0].roi for item in batch],
+                                      verbose=False, conf=CONF_THRESHOLD, imgsz=INFERENCE_IMGSZ)
+        metrics.mark("inferences", len(batch))
+
+        for (camera, generation, frame, slots, results, index), boxes in zip(batch, detections):
+            vehicles = boxes[np.isin(boxes[:, 5].astype(int), VEHICLE_CLASSES)]
+            if results is not None:
+                results.put(index, vehicles)
+            with metrics.timer("tracking"):
+                tracked = camera.tracker.update(frame, vehicles)
+            self.publish_tracked(camera, generation, frame, slots, tracked)
+        self.result_cache.maybe_flush()
+
+    def result_log(self, camera, index):
+        """Cached detections for the camera's current video and model settings; None for live sources."""
+        if index is None or camera.digest is None or self.model_digest is None:
+            return None
+        return self.result_cache.log(camera.digest, {
+            "weights": self.model_digest, "backend": self.backend["backend"], "int8": self.backend["int8"],
+            "conf": CONF_THRESHOLD, "imgsz": INFERENCE_IMGSZ, "tile": TILE_SIZE,
+            "region": camera.roi.region, "classes": VEHICLE_CLASSES,
+        })
+
+    def publish_tracked(self, camera, generation, frame, slots, boxes):
+        # Check occupancy against the precomputed slot label map
+        with metrics.timer("occupancy"):
+            occupancy = camera.slot_index.occupancy(boxes, MIN_SLOT_OVERLAP)
+            vehicles = camera.tracker.slot_tracks(camera.slot_index)
+        camera.last_occupancy = occupancy
+        camera.last_vehicles = vehicles
+        metrics.incr("frames_dropped", put_latest(self.render_queue,
+                                                  (camera, generation, frame, slots, occupancy, vehicles)))
+
+    def render_loop(self):
+        """Stage 3: draw the overlay and publish frame and stats."""
+        while self.running:
+            try:
+                camera, generation, frame, slots, occupancy, vehicles = self.render_queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+
+            try:
+                self.render(camera, generation, frame, slots, occupancy, vehicles)
+            except Exception as e:
+                self.stage_failed("render", e)
+
+    def render(self, camera, generation, frame, slots, occupancy, vehicles):
+        """One render-stage item: overlay, stats, history and publishing."""
+        # Visuals, only while someone is watching; encoding happens per client in the broadcaster
+        watching = camera.broadcaster.has_subscribers
+        if watching and camera.process is not None:
+            # The capture process reuses the ring slot; viewers get a frame of their own
+            frame = frame.copy()
+        if occupancy is None:
+            if watching:
+                camera.broadcaster.publish(frame)
+            return
+        if watching:
+            with metrics.timer("overlay"):
+                # Outlines and slot IDs come from a layer redrawn only when a slot changes
+                camera.overlay.draw(frame, slots, occupancy)
+
+        with self.lock:
+            # Drop results computed for a replaced source or slot layout
+            if generation != camera.generation or slots is not camera.slots:
+                return
+            changed = occupancy != camera.occupancy or vehicles != camera.vehicles
+            now = time.time()
+            if changed:
+                camera.update_start_times(occupancy, vehicles, now)
+            camera.occupancy = occupancy
+            camera.vehicles = vehicles
+
+            # Metrics update
+            camera.stats = camera.build_stats(occupancy)
+            self.stats = self.build_site_stats()
+            if changed:
+                self.stats_broadcaster.publish(self.stats)
+
+        with metrics.timer("history"):
+            self.history.record(camera.id, occupancy, now)
+        metrics.mark("frames_rendered")
+
+        if watching:
+            camera.broadcaster.publish(frame)
+
+if DAEMON_SOCKET and not DAEMON_MODE:
+    # Web worker: the pipeline runs in the inference daemon
+    parking_system = RemoteSystem(DAEMON_SOCKET, DAEMON_AUTHKEY, JPEG_QUALITY)
+else:
+    parking_system = ParkingSystem()
+upload_store = UploadStore(UPLOADS_DIR)
 
 @app.get("/", response_class=HTMLResponse)
 async def index(request: Request):
@@ -266,44 +819,150 @@ async def settings(request: Request):
     return templates.TemplateResponse("settings.html", {"request": request, "active_page": "settings"})
 
 @app.get("/video_feed")
-async def video_feed():
-    def gen():
-        while True:
-            if parking_system.latest_frame:
-                yield (b'--frame\r\n'
-                       b'Content-Type: image/jpeg\r\n\r\n' + parking_system.latest_frame + b'\r\n')
-            time.sleep(0.04)
-    return StreamingResponse(gen(), media_type="multipart/x-mixed-replace; boundary=frame")
+async def video_feed(camera: str = None, quality: int = None, scale: float = 1.0):
+    cam = parking_system.get_camera(camera)
+    if cam is None:
+        return JSONResponse({"status": "error", "message": f"Unknown camera {camera}"}, status_code=404)
+    if quality is not None:
+        quality = min(max(quality, 10), 95)
+    scale = min(max(scale, 0.1), 1.0)
+    return StreamingResponse(cam.broadcaster.stream(quality, scale),
+                             media_type="multipart/x-mixed-replace; boundary=frame")
 
 @app.get("/stats")
-async def get_stats():
-    return parking_system.stats
+async def get_stats(camera: str = None):
+    if camera is None:
+        return parking_system.stats
+    cam = parking_system.get_camera(camera)
+    if cam is None:
+        return JSONResponse({"status": "error", "message": f"Unknown camera {camera}"}, status_code=404)
+    return cam.stats
+
+@app.get("/cameras")
+async def list_cameras():
+    return await asyncio.to_thread(parking_system.describe_cameras)
+
+@app.get("/stats/stream")
+async def stats_stream(camera: str = None):
+    select = None
+    if camera is not None:
+        cam = parking_system.get_camera(camera)
+        if cam is None:
+            return JSONResponse({"status": "error", "message": f"Unknown camera {camera}"}, status_code=404)
+        select = lambda stats: stats["cameras"][str(cam.id)]
+    return StreamingResponse(parking_system.stats_broadcaster.stream(select), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+def history_window(start, end):
+    end = time.time() if end is None else end
+    start = end - 24 * 3600 if start is None else start
+    return start, end
+
+@app.get("/history/range")
+async def history_range(start: float = None, end: float = None, camera: int = None, slot: int = None,
+                        limit: int = 10000):
+    start, end = history_window(start, end)
+    return await asyncio.to_thread(parking_system.history.range, start, end, camera, slot, limit)
+
+@app.get("/history/downsample")
+async def history_downsample(start: float = None, end: float = None, bucket: int = 3600, camera: int = None):
+    start, end = history_window(start, end)
+    return await asyncio.to_thread(parking_system.history.downsample, start, end, max(bucket, 60), camera)
+
+@app.get("/history/dwell")
+async def history_dwell(start: float = None, end: float = None, camera: int = None, slot: int = None):
+    start, end = history_window(start, end)
+    return await asyncio.to_thread(parking_system.history.dwell, start, end, camera, slot)
+
+@app.get("/metrics")
+async def get_metrics():
+    text = await asyncio.to_thread(parking_system.metrics_text)
+    return Response(text, media_type="text/plain; version=0.0.4")
+
+@app.get("/debug/perf")
+async def debug_perf():
+    return await asyncio.to_thread(parking_system.metrics_snapshot)
+
+@app.get("/ready")
+async def ready():
+    """Startup progress; 503 until the model is loaded and every camera has been opened."""
+    status = await asyncio.to_thread(parking_system.readiness)
+    return JSONResponse(status, status_code=200 if status["ready"] else 503)
+
+@app.get("/debug/profile")
+async def debug_profile(seconds: float = 5.0):
+    """Sample the stacks of every thread for a few seconds and report the hottest functions."""
+    seconds = min(max(seconds, 0.5), 60.0)
+    return await asyncio.to_thread(parking_system.profile, seconds)
 
 @app.post("/save_settings")
 async def save_settings(request: Request):
     data = await request.json()
     sensitivity = data.get("sensitivity", 0.2)
-    parking_system.update_settings(sensitivity)
+    await asyncio.to_thread(parking_system.update_settings, sensitivity, data.get("detect_every"))
     return {"status": "success", "message": "Settings applied"}
 
 @app.post("/auto_detect")
-async def auto_detect():
-    parking_system.run_auto_discovery()
-    return {"status": "success", "message": "Auto-detection complete. Slots identified."}
+async def auto_detect(camera: str = None, refresh: bool = False):
+    if parking_system.get_camera(camera) is None:
+        return JSONResponse({"status": "error", "message": f"Unknown camera {camera}"}, status_code=404)
+    if not await asyncio.to_thread(parking_system.run_auto_discovery, camera, refresh):
+        return JSONResponse({"status": "error", "message": "No frame available for auto-detection."}, status_code=503)
+    return {"status": "success", "message": "Auto-detection started. Slots will update shortly."}
+
+async def iter_upload(upload, chunk_size=1 << 20):
+    while True:
+        chunk = await upload.read(chunk_size)
+        if not chunk:
+            break
+        yield chunk
 
 @app.post("/upload_video")
-async def upload_video(file: UploadFile = File(...)):
-    uploads_dir = "uploads"
-    if not os.path.exists(uploads_dir):
-        os.makedirs(uploads_dir)
-    
-    file_path = os.path.join(uploads_dir, file.filename)
-    with open(file_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
-    
-    parking_system.switch_video(file_path)
-    return {"status": "success", "message": f"Successfully uploaded {file.filename}."}
+async def upload_video(request: Request, camera: str = None, filename: str = None):
+    """Accepts the video as a raw request body (X-Filename header) or as a multipart `file` field."""
+    if parking_system.get_camera(camera) is None:
+        return JSONResponse({"status": "error", "message": f"Unknown camera {camera}"}, status_code=404)
+
+    upload_id = request.headers.get("x-upload-id")
+    if request.headers.get("content-type", "").startswith("multipart/form-data"):
+        form = await request.form()
+        upload = form.get("file")
+        if upload is None:
+            return JSONResponse({"status": "error", "message": "Missing file field."}, status_code=400)
+        filename, total, chunks = upload.filename, upload.size, iter_upload(upload)
+    else:
+        filename = filename or unquote(request.headers.get("x-filename", "upload.mp4"))
+        length = request.headers.get("content-length")
+        total, chunks = (int(length) if length else None), request.stream()
+
+    async def start_early(path):
+        # Enough has arrived to decode: start streaming before the upload completes
+        await asyncio.to_thread(parking_system.switch_video, path, camera)
+
+    record = await upload_store.receive(chunks, filename, upload_id, total, start_early)
+    await asyncio.to_thread(parking_system.switch_video, record["path"], camera, record["progressive"])
+    note = " (identical video already stored)" if record["duplicate"] else ""
+    return {"status": "success", "message": f"Successfully uploaded {filename}{note}.", "upload": record}
+
+@app.get("/upload_progress/{upload_id}")
+async def upload_progress(upload_id: str):
+    record = upload_store.status(upload_id)
+    if record is None:
+        return JSONResponse({"status": "error", "message": f"Unknown upload {upload_id}"}, status_code=404)
+    return record
 
 if __name__ == "__main__":
-    import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    if DAEMON_MODE:
+        # python server.py --daemon [socket]: run the pipeline only, serving web workers over the socket
+        args = sys.argv[sys.argv.index("--daemon") + 1:]
+        address = args[0] if args else DAEMON_SOCKET or "/tmp/parking-daemon.sock"
+        parking_system.start()
+        try:
+            DaemonServer(parking_system, address, DAEMON_AUTHKEY, JPEG_QUALITY).serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            parking_system.stop()
+    else:
+        import uvicorn
+        uvicorn.run(app, host="0.0.0.0", port=8000)
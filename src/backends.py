@@ -0,0 +1,156 @@
+import importlib.util
+import json
+import os
+import time
+import cv2
+import numpy as np
+import yaml
+from ultralytics import YOLO
+from src.tracker import box_iou
+
+# Tried in this order; "torch" runs the weights as they are and is always available
+BACKENDS = ["openvino", "onnx", "torch"]
+RUNTIME_MODULES = {"openvino": "openvino", "onnx": "onnxruntime", "torch": "torch"}
+EXPORT_FORMATS = {"openvino": "openvino", "onnx": "onnx"}
+
+def available_backends():
+    return [b for b in BACKENDS if importlib.util.find_spec(RUNTIME_MODULES[b]) is not None]
+
+def artifact_path(weights, backend, imgsz=640, int8=False):
+    """Cache location of the `backend` export of `weights`, next to the weights file."""
+    if backend == "torch":
+        return weights
+    stem = f"{os.path.splitext(weights)[0]}_{imgsz}{'_int8' if int8 else ''}"
+    # Ultralytics recognizes OpenVINO models by the directory suffix
+    return f"{stem}.onnx" if backend == "onnx" else f"{stem}_openvino_model"
+
+def export_model(weights, backend, imgsz=640, int8=False, calibration=None):
+    """Export `weights` for `backend` once; later calls reuse the cached artifact."""
+    target = artifact_path(weights, backend, imgsz, int8)
+    if os.path.exists(target):
+        return target
+    kwargs = {"format": EXPORT_FORMATS[backend], "imgsz": imgsz, "dynamic": True}
+    if int8:
+        if calibration is None:
+            raise ValueError("INT8 export needs calibration frames")
+        kwargs.update(int8=True, data=calibration)
+    print(f"DEBUG: Exporting {weights} for {backend}{' (INT8)' if int8 else ''}, this runs once...")
+    exported = YOLO(weights).export(**kwargs)
+    os.replace(str(exported).rstrip(os.sep), target)
+    return target
+
+def read_frames(sources, count):
+    """Up to `count` frames spread evenly over the video files in `sources`."""
+    files = [s for s in sources if isinstance(s, str) and os.path.isfile(s)]
+    frames = []
+    for source in files:
+        cap = cv2.VideoCapture(source)
+        total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        wanted = max(1, count // len(files))
+        for position in np.linspace(0, max(0, total - 1), wanted).astype(int):
+            cap.set(cv2.CAP_PROP_POS_FRAMES, position)
+            ok, frame = cap.read()
+            if ok:
+                frames.append(frame)
+        cap.release()
+    return frames
+
+def build_calibration_set(weights, sources, names, count=300):
+    """Write frames of our own footage as a YOLO dataset for INT8 calibration; returns its data.yaml."""
+    directory = f"{os.path.splitext(weights)[0]}_calibration"
+    data_path = os.path.join(directory, "data.yaml")
+    if os.path.exists(data_path):
+        return data_path
+    frames = read_frames(sources, count)
+    if not frames:
+        raise ValueError("No calibration frames could be read from the configured video sources")
+    images = os.path.join(directory, "images", "val")
+    os.makedirs(images, exist_ok=True)
+    for i, frame in enumerate(frames):
+        cv2.imwrite(os.path.join(images, f"{i:04d}.jpg"), frame)
+    with open(data_path, "w") as f:
+        yaml.safe_dump({"path": os.path.abspath(directory), "train": "images/val", "val": "images/val",
+                        "names": dict(names)}, f)
+    return data_path
+
+def measure_fps(model, frames, imgsz=640, warmup=3, runs=10):
+    """Frames per second of `model` on `frames` after warm-up.
+
+    Every backend is timed on the same frames, batch and input size, so the
+    numbers compare directly.
+    """
+    for _ in range(warmup):
+        model(frames, verbose=False, imgsz=imgsz)
+    started = time.perf_counter()
+    for _ in range(runs):
+        model(frames, verbose=False, imgsz=imgsz)
+    return round(runs * len(frames) / (time.perf_counter() - started), 2)
+
+def agreement(reference, boxes, iou_threshold=0.5):
+    """Share of reference boxes matched by a box of the same class (IoU >= iou_threshold)."""
+    matched = total = 0
+    for ref, other in zip(reference, boxes):
+        total += len(ref)
+        if len(ref) and len(other):
+            iou = box_iou(ref, other)
+            iou[ref[:, None, 5] != other[None, :, 5]] = 0
+            matched += int((iou.max(axis=1) >= iou_threshold).sum())
+    return round(matched / total, 3) if total else 1.0
+
+def choice_path(weights, imgsz=640, int8=False):
+    return f"{os.path.splitext(weights)[0]}_{imgsz}{'_int8' if int8 else ''}_backend.json"
+
+def load_backend(weights, backend="auto", imgsz=640, int8=False, sources=(), frames=None):
+    """Load `weights` on one runtime, or on the fastest installed one when `backend` is "auto".
+
+    Exports are cached next to the weights. Every candidate is warmed up and
+    timed on the same sample frame before serving. Returns the model and a
+    report with the chosen backend and the FPS of each candidate. In "auto"
+    mode the report also shows how many of the PyTorch detections each
+    backend reproduces. The "auto" choice is remembered next to the weights
+    and reused until the set of installed runtimes changes.
+    """
+    candidates = available_backends() if backend == "auto" else [backend]
+    if backend == "auto" and os.path.exists(choice_path(weights, imgsz, int8)):
+        with open(choice_path(weights, imgsz, int8)) as f:
+            previous = json.load(f)
+        if list(previous["fps"]) == candidates:
+            model, report = load_backend(weights, previous["backend"], imgsz, int8, sources, frames)
+            if report["backend"] == previous["backend"]:
+                return model, {**previous, "fps": {**previous["fps"], **report["fps"]}}
+    frames = frames or read_frames(sources, 4) or [np.zeros((imgsz, imgsz, 3), np.uint8)]
+    calibration = None
+    if int8:
+        calibration = build_calibration_set(weights, sources, YOLO(weights).names)
+
+    report = {"backend": None, "artifact": None, "int8": int8, "imgsz": imgsz, "fps": {}, "agreement": {}}
+    models = {}
+    for name in candidates:
+        try:
+            path = export_model(weights, name, imgsz, int8 and name != "torch", calibration)
+            model = YOLO(path, task="detect")
+            report["fps"][name] = measure_fps(model, frames[:1], imgsz)
+        except Exception as e:
+            print(f"WARNING: Inference backend {name} is unavailable: {e}")
+            continue
+        models[name] = (model, path)
+    if not models:
+        if "torch" in candidates:
+            raise RuntimeError(f"No usable inference backend among {candidates}")
+        print("WARNING: Falling back to the torch backend.")
+        return load_backend(weights, "torch", imgsz, False, sources, frames)
+
+    if len(models) > 1 and "torch" in models:
+        reference = [r.boxes.data.cpu().numpy() for r in models["torch"][0](frames, verbose=False, imgsz=imgsz)]
+        for name, (model, _) in models.items():
+            report["agreement"][name] = agreement(reference, [r.boxes.data.cpu().numpy()
+                                                              for r in model(frames, verbose=False, imgsz=imgsz)])
+
+    best = max(models, key=lambda name: report["fps"][name])
+    report["backend"] = best
+    report["artifact"] = models[best][1]
+    if backend == "auto" and list(report["fps"]) == candidates:
+        with open(choice_path(weights, imgsz, int8), "w") as f:
+            json.dump(report, f, indent=2)
+    print(f"DEBUG: Inference backend {best} ({report['fps'][best]} FPS); candidates: {report['fps']}")
+    return models[best][0], report
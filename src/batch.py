@@ -0,0 +1,150 @@
+import csv
+import json
+import math
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+import cv2
+import numpy as np
+
+BATCH_SIZE = 8
+
+def init_worker(threads):
+    # Keep workers x torch threads within the machine's cores
+    import torch
+    torch.set_num_threads(threads)
+
+def process_range(video_path, model_path, slots_path, start, end, stride, fps, min_overlap, motion_gate,
+                  tile_size, imgsz, detect_every=1, backend="torch", int8=False):
+    """Analyze every `stride`-th frame in [start, end); runs inside a pool worker with its own model."""
+    from src.detector import ParkingDetector
+
+    detector = ParkingDetector(model_path=model_path, slots_path=slots_path, min_overlap=min_overlap,
+                               motion_gate=motion_gate, tile_size=tile_size, imgsz=imgsz,
+                               detect_every=detect_every, backend=backend, int8=int8, sources=[video_path])
+    cap = cv2.VideoCapture(video_path)
+    first = int(math.ceil(start / stride)) * stride
+    cap.set(cv2.CAP_PROP_POS_FRAMES, first)
+
+    frame_ids = []
+    # None marks a frame skipped by the motion gate; it inherits the previous row
+    rows = []
+    pending = []
+    started = time.time()
+
+    def flush():
+        for (row, _), occupancy in zip(pending, detector.analyze([frame for _, frame in pending])):
+            rows[row] = occupancy
+        pending.clear()
+
+    index = first
+    # None until the first inference, which the motion gate must not skip
+    last_result = None
+    while index < end:
+        if not cap.grab():
+            break
+        if (index - first) % stride == 0:
+            ok, frame = cap.retrieve()
+            if not ok:
+                break
+            frame_ids.append(index)
+            rows.append(None)
+            # Staleness is measured in video time so results do not depend on processing speed
+            if detector.needs_inference(frame, last_result, now=index / fps):
+                if detect_every > 1:
+                    # Tracking follows the frames in order, so hybrid mode cannot batch
+                    last_result = rows[-1] = detector.track(frame, last_result)
+                else:
+                    pending.append((len(rows) - 1, frame))
+                    last_result = True
+                    if len(pending) >= BATCH_SIZE:
+                        flush()
+        index += 1
+    flush()
+    cap.release()
+
+    for i in range(1, len(rows)):
+        if rows[i] is None:
+            rows[i] = rows[i - 1]
+    skipped = detector.motion_gate.skip_ratio if detector.motion_gate else 0.0
+    return frame_ids, rows, time.time() - started, skipped
+
+def split_ranges(frame_count, parts, stride):
+    """Split [0, frame_count) into `parts` ranges whose sizes are multiples of `stride`."""
+    chunk = int(math.ceil(frame_count / parts / stride)) * stride
+    return [(s, min(s + chunk, frame_count)) for s in range(0, frame_count, max(chunk, stride))]
+
+def write_timeline(path, fps, frame_ids, rows, slot_count):
+    columns = [f"slot_{i+1}" for i in range(slot_count)]
+    if path.endswith(".parquet"):
+        import pandas as pd
+        df = pd.DataFrame(np.array(rows, dtype=np.uint8).reshape(len(rows), slot_count), columns=columns)
+        df.insert(0, "time_s", np.round(np.array(frame_ids) / fps, 3))
+        df.insert(0, "frame", frame_ids)
+        df.to_parquet(path, index=False)
+        return
+
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["frame", "time_s"] + columns)
+        for frame_id, occupancy in zip(frame_ids, rows):
+            writer.writerow([frame_id, round(frame_id / fps, 3)] + [int(o) for o in occupancy])
+
+def run_batch(video_path, slots_path, model_path, output_path, stride=1, workers=None, min_overlap=None,
+              motion_gate=True, tile_size=None, imgsz=640, detect_every=1, backend="auto", int8=False):
+    """Headless occupancy analysis of a recorded video, sharded by time range over a process pool."""
+    if not os.path.exists(slots_path):
+        print(f"Error: Slots file {slots_path} not found. Run --mode select first.")
+        return None
+    with open(slots_path, "r") as f:
+        slot_count = len(json.load(f))
+
+    cap = cv2.VideoCapture(video_path)
+    frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    fps = cap.get(cv2.CAP_PROP_FPS) or 25.0
+    cap.release()
+    if frame_count <= 0:
+        print(f"Error: Could not read frame count of {video_path}.")
+        return None
+
+    stride = max(1, stride)
+    workers = max(1, workers or os.cpu_count() or 1)
+    ranges = split_ranges(frame_count, workers, stride)
+    threads = max(1, (os.cpu_count() or 1) // len(ranges))
+    if backend == "auto":
+        # Pick the runtime once here; workers then load the cached export directly
+        from src.backends import load_backend
+        backend = load_backend(model_path, backend, imgsz, int8, [video_path])[1]["backend"]
+    print(f"Analyzing {frame_count} frames (stride {stride}) in {len(ranges)} shards on {backend}...")
+
+    started = time.time()
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=len(ranges), mp_context=context,
+                             initializer=init_worker, initargs=(threads,)) as pool:
+        futures = [pool.submit(process_range, video_path, model_path, slots_path, s, e, stride, fps,
+                               min_overlap, motion_gate, tile_size, imgsz, detect_every, backend, int8)
+                   for s, e in ranges]
+        shards = [f.result() for f in futures]
+    elapsed = time.time() - started
+
+    frame_ids, rows = [], []
+    for ids, occupancy, _, _ in shards:
+        frame_ids.extend(ids)
+        rows.extend(occupancy)
+    write_timeline(output_path, fps, frame_ids, rows, slot_count)
+
+    analyzed = len(frame_ids)
+    skipped = sum(skip * len(ids) for ids, _, _, skip in shards) / max(1, analyzed)
+    report = {
+        "frames": frame_count,
+        "analyzed": analyzed,
+        "seconds": round(elapsed, 2),
+        "analyzed_fps": round(analyzed / elapsed, 1) if elapsed else 0.0,
+        "video_fps": round(frame_count / elapsed, 1) if elapsed else 0.0,
+        "skip_ratio": round(skipped, 3),
+    }
+    print(f"Wrote {analyzed} rows to {output_path} in {report['seconds']}s "
+          f"({report['analyzed_fps']} analyzed fps, {report['video_fps']} video fps, "
+          f"{report['skip_ratio']:.0%} skipped by motion gate).")
+    return report
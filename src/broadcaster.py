@@ -0,0 +1,190 @@
+import asyncio
+import json
+import threading
+import cv2
+import numpy as np
+from src.metrics import metrics
+
+def encode_jpeg(frame, quality, scale=1.0):
+    with metrics.timer("encode"):
+        if scale != 1.0:
+            h, w = frame.shape[:2]
+            frame = cv2.resize(frame, (max(1, int(w * scale)), max(1, int(h * scale))), interpolation=cv2.INTER_AREA)
+        _, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, int(quality)])
+    return buffer.tobytes()
+
+def reencode_jpeg(jpeg, quality, scale=1.0):
+    frame = cv2.imdecode(np.frombuffer(jpeg, np.uint8), cv2.IMREAD_COLOR)
+    return encode_jpeg(frame, quality, scale)
+
+class Channel:
+    """Latest-value channel from a worker thread to asyncio clients.
+
+    Publishing bumps a version counter and wakes waiting clients through an
+    asyncio.Condition on the server's event loop; clients always read the
+    newest value, so bursts of updates coalesce for slow consumers.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.value = None
+        self.version = 0
+        self.subscribers = 0
+        # Clients served by other processes (web workers of the inference daemon)
+        self.remote_subscribers = 0
+        # Called from the publishing thread with every new value
+        self.listeners = []
+        self.loop = None
+        self.condition = None
+
+    @property
+    def has_subscribers(self):
+        return self.subscribers + self.remote_subscribers > 0
+
+    def attach(self):
+        """Bind to the running event loop on the first subscription."""
+        if self.loop is None:
+            self.condition = asyncio.Condition()
+            self.loop = asyncio.get_running_loop()
+
+    def publish(self, value):
+        """Called from worker threads. `value` must not be modified afterwards."""
+        with self.lock:
+            self.value = value
+            self.version += 1
+            loop = self.loop
+        for listener in self.listeners:
+            listener(value)
+        if loop is not None:
+            try:
+                asyncio.run_coroutine_threadsafe(self.notify(), loop)
+            except RuntimeError:
+                pass # Event loop already closed
+
+    async def notify(self):
+        async with self.condition:
+            self.condition.notify_all()
+
+    def latest(self):
+        with self.lock:
+            return self.version, self.value
+
+    async def wait_newer(self, seen, timeout=None):
+        """Wait for a version newer than `seen`; returns (version, value) or None on timeout."""
+        async with self.condition:
+            try:
+                await asyncio.wait_for(self.condition.wait_for(lambda: self.version > seen), timeout)
+            except asyncio.TimeoutError:
+                return None
+        return self.latest()
+
+class FrameBroadcaster(Channel):
+    """Fans the newest annotated frame of one camera out to MJPEG clients.
+
+    JPEG encoding happens lazily, once per frame and (quality, scale) pair, so
+    nothing is encoded while nobody is watching and a slow client simply
+    jumps to the newest frame on its next iteration. Frames relayed by the
+    inference daemon arrive already encoded and are only re-encoded for
+    clients asking for another quality or scale.
+    """
+
+    def __init__(self, quality=80):
+        super().__init__()
+        self.quality = quality
+        self.encodes = {}
+
+    async def get_jpeg(self, version, frame, quality, scale):
+        # Clients waiting on the same frame and settings share one encode
+        if isinstance(frame, bytes) and quality == self.quality and scale == 1.0:
+            return frame
+        key = (version, quality, scale)
+        task = self.encodes.get(key)
+        if task is None:
+            self.encodes = {k: t for k, t in self.encodes.items() if k[0] == version}
+            task = asyncio.ensure_future(asyncio.to_thread(reencode_jpeg if isinstance(frame, bytes) else encode_jpeg,
+                                                           frame, quality, scale))
+            self.encodes[key] = task
+        return await task
+
+    async def stream(self, quality=None, scale=1.0):
+        """Async generator of multipart MJPEG parts for one client."""
+        self.attach()
+        quality = quality or self.quality
+        self.subscribers += 1
+        try:
+            seen, _ = self.latest()
+            while True:
+                seen, frame = await self.wait_newer(seen)
+                jpeg = await self.get_jpeg(seen, frame, quality, scale)
+                yield (b'--frame\r\n'
+                       b'Content-Type: image/jpeg\r\n\r\n' + jpeg + b'\r\n')
+        finally:
+            self.subscribers -= 1
+
+def stats_delta(old, new):
+    """Changed fields between two stats dicts, or None when a full snapshot is needed.
+
+    Slot lists are diffed into {index: state}; nested dicts (per-camera stats)
+    are diffed recursively.
+    """
+    delta = {}
+    for key, value in new.items():
+        previous = old.get(key)
+        if isinstance(value, list) and isinstance(previous, list):
+            if len(value) != len(previous):
+                return None
+            changed = {i: v for i, (p, v) in enumerate(zip(previous, value)) if p != v}
+            if changed:
+                delta[key] = changed
+        elif isinstance(value, dict) and isinstance(previous, dict):
+            sub = stats_delta(previous, value)
+            if sub is None:
+                return None
+            if sub:
+                delta[key] = sub
+        elif value != previous:
+            delta[key] = value
+    if set(old) - set(new):
+        return None
+    return delta
+
+class StatsBroadcaster(Channel):
+    """Pushes occupancy stats to Server-Sent Events clients.
+
+    A client receives a full `snapshot` event on connect, then `delta` events
+    holding only what changed since the last event it was sent. Updates are
+    sent at most every `min_interval` seconds per client, so bursts of slot
+    flips coalesce into one event.
+    """
+
+    def __init__(self, min_interval=0.25, keepalive=15.0):
+        super().__init__()
+        self.min_interval = min_interval
+        self.keepalive = keepalive
+
+    async def stream(self, select=None):
+        """Async generator of SSE messages; `select` narrows the stats, e.g. to one camera."""
+        self.attach()
+        self.subscribers += 1
+        try:
+            seen, stats = self.latest()
+            sent = None
+            while True:
+                if stats is not None:
+                    current = select(stats) if select else stats
+                    delta = stats_delta(sent, current) if sent is not None else None
+                    if delta is None:
+                        yield f"event: snapshot\ndata: {json.dumps(current)}\n\n"
+                    elif delta:
+                        yield f"event: delta\ndata: {json.dumps(delta)}\n\n"
+                    sent = current
+                    await asyncio.sleep(self.min_interval)
+
+                update = await self.wait_newer(seen, self.keepalive)
+                if update is None:
+                    yield ": keepalive\n\n"
+                    stats = None
+                    continue
+                seen, stats = update
+        finally:
+            self.subscribers -= 1
@@ -0,0 +1,183 @@
+import multiprocessing
+import os
+import queue
+import threading
+import time
+import cv2
+from src.frame_ring import FrameRing
+from src.reader import FrameReader
+
+def capture_main(conn, rate):
+    """Capture process: decode one source at `rate` (a shared double, frames/s) into a FrameRing.
+
+    Commands arrive on `conn`: ("open", source, resume, generation),
+    ("ring", spec) and ("stop",). Each frame written to the ring is announced
+    with ("frame", number, slot, skipped). A frame that does not fit the ring
+    is dropped after asking the parent for a larger one with ("resize", shape),
+    and so is one for which the parent still holds every slot.
+    """
+    cap = reader = ring = None
+    generation = 0
+    next_sample = 0
+    requested = None
+    while True:
+        if reader is None or not cap.isOpened():
+            timeout = None if reader is None else 1.0
+        else:
+            timeout = 0 if reader.live else max(0.0, next_sample - time.time())
+        if conn.poll(timeout):
+            command, *args = conn.recv()
+            if command == "stop":
+                break
+            if command == "open":
+                source, resume, generation = args
+                new_cap = cv2.VideoCapture(source)
+                if resume and cap is not None:
+                    new_cap.set(cv2.CAP_PROP_POS_FRAMES, cap.get(cv2.CAP_PROP_POS_FRAMES))
+                if cap is not None:
+                    cap.release()
+                cap = new_cap
+                live = not (isinstance(source, str) and os.path.isfile(source))
+                reader = FrameReader(cap, live, cap.get(cv2.CAP_PROP_FPS))
+                shape = (int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)), int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), 3)
+                conn.send(("opened", cap.isOpened(), live, reader.fps, shape))
+                next_sample = 0
+            elif command == "ring":
+                if ring is not None:
+                    ring.close()
+                ring = FrameRing.attach(args[0])
+            continue
+        if reader is None or not cap.isOpened():
+            continue
+
+        if reader.live:
+            # grab() blocks until the source delivers, so draining keeps pace with the stream
+            if not reader.drain():
+                time.sleep(1)
+                continue
+            if time.time() < next_sample:
+                continue
+        started = time.time()
+        frame = reader.sample()
+        if frame is None:
+            time.sleep(1)
+            continue
+        if ring is not None and ring.fits(frame.shape):
+            written = ring.write(frame, generation, reader.index)
+            if written is None:
+                reader.skipped += 1
+            else:
+                conn.send(("frame", *written, reader.skipped))
+        elif frame.shape != requested:
+            requested = frame.shape
+            conn.send(("resize", frame.shape))
+        next_sample = started + 1.0 / max(rate.value, 0.1)
+    if cap is not None:
+        cap.release()
+    if ring is not None:
+        ring.close()
+
+class CaptureProcess:
+    """Parent-side handle of a capture process that decodes one camera's source into a FrameRing.
+
+    Decoding and sampling run in the child, outside this process's GIL. The
+    parent maps the frames as NumPy views; `frames` yields them on the one
+    thread that reads the pipe, each pinning its slot until it is garbage
+    collected. The ring is created here, sized to the source, and replaced
+    when a new source has larger frames; a replaced ring is freed once no
+    frame from it is left in the pipeline.
+    """
+
+    def __init__(self, name, slots=16, timeout=30.0):
+        # Spawn, not fork: the parent already runs threads (and possibly a model)
+        context = multiprocessing.get_context("spawn")
+        self.conn, child = context.Pipe()
+        self.rate = context.Value("d", 1.0, lock=False)
+        self.process = context.Process(target=capture_main, args=(child, self.rate), name=name, daemon=True)
+        self.process.start()
+        child.close()
+        self.slots = slots
+        self.timeout = timeout
+        self.ring = None
+        # Replaced rings stay mapped while frames from them are still pinned
+        self.retired = []
+        self.replies = queue.Queue()
+        self.send_lock = threading.Lock()
+        self.ring_lock = threading.Lock()
+        self.live = False
+        self.skipped = 0
+
+    def send(self, *message):
+        with self.send_lock:
+            self.conn.send(message)
+
+    def open(self, source, resume, generation):
+        """Switch the child to `source`; returns (opened, live, fps). Needs `frames` running on another thread."""
+        self.send("open", source, resume, generation)
+        opened, live, fps, shape = self.replies.get(timeout=self.timeout)
+        if shape[0] > 0 and shape[1] > 0:
+            self.ensure_ring(shape)
+        self.live = live
+        return opened, live, fps
+
+    def ensure_ring(self, shape):
+        with self.ring_lock:
+            if self.ring is not None and self.ring.fits(shape):
+                return
+            if self.ring is not None:
+                self.retired.append(self.ring)
+            self.ring = FrameRing.create(self.slots, *shape)
+            self.send("ring", self.ring.spec)
+
+    def free_retired(self):
+        with self.ring_lock:
+            for ring in [r for r in self.retired if r.pinned == 0]:
+                ring.close()
+                self.retired.remove(ring)
+
+    def frames(self):
+        """Yield (generation, index, frame view) for each frame the child writes, until it exits."""
+        while True:
+            try:
+                message = self.conn.recv()
+            except (EOFError, OSError):
+                return
+            kind = message[0]
+            if self.retired:
+                self.free_retired()
+            if kind == "frame":
+                _, number, slot, self.skipped = message
+                item = self.ring.acquire(slot, number) if self.ring is not None else None
+                if item is not None:
+                    yield item
+                del item
+            elif kind == "opened":
+                self.replies.put(message[1:])
+            elif kind == "resize":
+                self.ensure_ring(message[1])
+
+    def latest(self):
+        """A copy of the newest frame as (generation, index, frame), or None."""
+        ring = self.ring
+        if ring is None:
+            return None
+        number, slot = ring.head
+        item = ring.read(slot, number) if number else None
+        if item is None:
+            return None
+        generation, index, frame = item
+        frame = frame.copy()
+        # Seqlock check: the writer may have reused the slot while it was copied
+        return (generation, index, frame) if ring.valid(slot, number) else None
+
+    def stop(self):
+        try:
+            self.send("stop")
+        except OSError:
+            pass
+        self.process.join(2)
+        if self.process.is_alive():
+            self.process.terminate()
+        for ring in self.retired + [self.ring]:
+            if ring is not None:
+                ring.close()
@@ -0,0 +1,363 @@
+import os
+import secrets
+import threading
+import time
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client, Listener
+from src.broadcaster import FrameBroadcaster, StatsBroadcaster, encode_jpeg
+from src.metrics import metrics
+
+# Calls web workers may make on the daemon's ParkingSystem
+COMMANDS = {"switch_video", "update_settings", "run_auto_discovery", "readiness", "describe_cameras",
+            "metrics_text", "metrics_snapshot", "profile"}
+HISTORY_QUERIES = {"range", "downsample", "dwell"}
+
+def key_path(address):
+    return address + ".key"
+
+def create_key(address):
+    """Generate a fresh authentication key and store it next to the socket, readable by this user only."""
+    key = secrets.token_hex(32)
+    fd = os.open(key_path(address), os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "w") as f:
+        os.fchmod(fd, 0o600) # The file may predate this run with looser permissions
+        f.write(key)
+    return key.encode()
+
+def read_key(address):
+    try:
+        with open(key_path(address)) as f:
+            return f.read().strip().encode()
+    except OSError as e:
+        raise ConnectionError(f"No key for the inference daemon: set PARKING_DAEMON_KEY or start the daemon "
+                              f"first ({e})") from e
+
+class Outbox:
+    """Latest-value send buffer for one subscribed worker.
+
+    An update that is still unsent when a newer one with the same key
+    arrives is replaced, so a worker that falls behind skips to the newest
+    frame of each camera instead of building a backlog in the daemon.
+    """
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.pending = {}
+        self.condition = threading.Condition()
+
+    def offer(self, key, message):
+        with self.condition:
+            self.pending[key] = message
+            self.condition.notify()
+
+    def run(self):
+        """Send until the worker disconnects."""
+        while True:
+            with self.condition:
+                while not self.pending:
+                    self.condition.wait()
+                messages = list(self.pending.values())
+                self.pending.clear()
+            for message in messages:
+                self.conn.send(message)
+
+class DaemonServer:
+    """Serves a running ParkingSystem to web workers over a Unix socket.
+
+    Each worker opens a subscription connection, on which the daemon pushes
+    the stats and every watched camera's newest frame as JPEG, and a command
+    connection for request/response calls such as settings changes,
+    uploads switching the source, and history queries. Frames are encoded
+    once here however many workers relay them, and the pipeline draws
+    overlays only while some worker has viewers.
+    """
+
+    def __init__(self, system, address, authkey=None, quality=80, stats_interval=0.25):
+        self.system = system
+        self.address = address
+        # Without a configured key, a random one is written to <socket>.key (mode 0600) for the workers
+        self.authkey = authkey or create_key(address)
+        self.quality = quality
+        self.stats_interval = stats_interval
+        self.lock = threading.Lock()
+        self.outboxes = []
+        # command connection -> {camera id: viewers}
+        self.watching = {}
+        self.frames = {}
+        self.frame_events = {}
+
+    def serve_forever(self):
+        if os.path.exists(self.address):
+            os.remove(self.address) # Left behind by a daemon that did not shut down cleanly
+        # Only this user may connect: the socket is created 0600, not with the default umask
+        umask = os.umask(0o177)
+        try:
+            listener = Listener(self.address, "AF_UNIX", authkey=self.authkey)
+        finally:
+            os.umask(umask)
+        os.chmod(self.address, 0o600)
+        print(f"DEBUG: Inference daemon listening on {self.address}")
+        for camera in self.system.cameras:
+            self.frame_events[camera.id] = threading.Event()
+            camera.broadcaster.listeners.append(lambda frame, camera=camera: self.frame_published(camera, frame))
+            threading.Thread(target=self.encode_loop, args=(camera,), name=f"encode-{camera.id}", daemon=True).start()
+        threading.Thread(target=self.stats_loop, name="stats-publisher", daemon=True).start()
+        try:
+            while True:
+                try:
+                    conn = listener.accept()
+                except Exception as e:
+                    print(f"WARNING: Rejected worker connection: {e}")
+                    continue
+                threading.Thread(target=self.handle, args=(conn,), name="worker-conn", daemon=True).start()
+        finally:
+            listener.close()
+
+    def offer(self, key, message):
+        with self.lock:
+            outboxes = list(self.outboxes)
+        for outbox in outboxes:
+            outbox.offer(key, message)
+
+    def frame_published(self, camera, frame):
+        # Called on the render thread: hand the frame to this camera's encoder and return
+        self.frames[camera.id] = frame
+        self.frame_events[camera.id].set()
+
+    def encode_loop(self, camera):
+        event = self.frame_events[camera.id]
+        while True:
+            event.wait()
+            event.clear()
+            jpeg = encode_jpeg(self.frames[camera.id], self.quality)
+            self.offer(("frame", camera.id), ("frame", camera.id, jpeg))
+
+    def stats_loop(self):
+        sent = None
+        while True:
+            stats = self.system.stats
+            if stats is not sent:
+                self.offer(("stats", None), ("stats", None, stats))
+                sent = stats
+            time.sleep(self.stats_interval)
+
+    def handle(self, conn):
+        try:
+            role = conn.recv()
+            if role == "subscribe":
+                self.subscribe(conn)
+            else:
+                self.serve_commands(conn)
+        except (EOFError, OSError):
+            pass
+        finally:
+            self.set_watching(id(conn), None)
+            conn.close()
+
+    def subscribe(self, conn):
+        outbox = Outbox(conn)
+        outbox.offer(("stats", None), ("stats", None, self.system.stats))
+        with self.lock:
+            self.outboxes.append(outbox)
+        try:
+            outbox.run()
+        finally:
+            with self.lock:
+                self.outboxes.remove(outbox)
+
+    def serve_commands(self, conn):
+        while True:
+            name, args = conn.recv()
+            try:
+                result = self.call(id(conn), name, args)
+            except Exception as e:
+                conn.send(("error", f"{type(e).__name__}: {e}"))
+                continue
+            conn.send(("ok", result))
+
+    def call(self, key, name, args):
+        if name == "watching":
+            return self.set_watching(key, args[0])
+        if name == "history" and args and args[0] in HISTORY_QUERIES:
+            return getattr(self.system.history, args[0])(*args[1:])
+        if name not in COMMANDS:
+            raise ValueError(f"Unknown command {name}")
+        return getattr(self.system, name)(*args)
+
+    def set_watching(self, key, counts):
+        """Record how many viewers a worker has per camera; overlays and encoding run only while that is > 0."""
+        with self.lock:
+            if counts is None:
+                self.watching.pop(key, None)
+            else:
+                self.watching[key] = counts
+            for camera in self.system.cameras:
+                camera.broadcaster.remote_subscribers = sum(c.get(str(camera.id), 0) for c in self.watching.values())
+
+class RemoteCamera:
+    """A daemon camera as seen by a web worker: local fan-out of its frames and its latest stats."""
+
+    def __init__(self, id, quality):
+        self.id = id
+        self.broadcaster = FrameBroadcaster(quality)
+        self.stats = {}
+
+class RemoteHistory:
+    def __init__(self, system):
+        self.system = system
+
+    def range(self, *args):
+        return self.system.call("history", "range", *args)
+
+    def downsample(self, *args):
+        return self.system.call("history", "downsample", *args)
+
+    def dwell(self, *args):
+        return self.system.call("history", "dwell", *args)
+
+class RemoteSystem:
+    """Stand-in for ParkingSystem in web workers, backed by the inference daemon.
+
+    Offers the interface the endpoints use. Frames and stats arrive on a
+    subscription and are fanned out to this worker's clients locally; every
+    other call goes over the command connection.
+    """
+
+    def __init__(self, address, authkey=None, quality=80, timeout=30.0):
+        self.address = address
+        self.authkey = authkey
+        self.quality = quality
+        self.timeout = timeout
+        self.cameras = []
+        self.stats = {}
+        self.stats_broadcaster = StatsBroadcaster()
+        self.history = RemoteHistory(self)
+        self.command = None
+        self.command_lock = threading.Lock()
+        self.subscription = None
+        self.connected = False
+        self.running = False
+
+    def start(self):
+        if self.running:
+            return
+        self.running = True
+        threading.Thread(target=self.subscribe_loop, name="daemon-subscription", daemon=True).start()
+        threading.Thread(target=self.watch_loop, name="daemon-watching", daemon=True).start()
+
+    def stop(self):
+        self.running = False
+        for conn in (self.subscription, self.command):
+            if conn is not None:
+                conn.close()
+
+    def connect(self, role):
+        # The key file is re-read on every connection, so a restarted daemon's new key is picked up
+        try:
+            conn = Client(self.address, "AF_UNIX", authkey=self.authkey or read_key(self.address))
+        except AuthenticationError as e:
+            raise ConnectionError(f"Inference daemon refused the key: {e}") from e
+        conn.send(role)
+        return conn
+
+    def call(self, name, *args, timeout=None):
+        """Run a command on the daemon; raises ConnectionError when it cannot be reached."""
+        with self.command_lock:
+            for attempt in range(2):
+                try:
+                    if self.command is None:
+                        self.command = self.connect("command")
+                    self.command.send((name, args))
+                    if not self.command.poll(timeout or self.timeout):
+                        raise TimeoutError(f"Inference daemon did not answer {name}")
+                    status, result = self.command.recv()
+                    break
+                except (OSError, EOFError) as e:
+                    # A restarted daemon needs a fresh connection; retry once
+                    if self.command is not None:
+                        self.command.close()
+                    self.command = None
+                    if attempt:
+                        raise ConnectionError(f"Inference daemon unavailable: {e}") from e
+        if status == "error":
+            raise RuntimeError(result)
+        return result
+
+    def subscribe_loop(self):
+        while self.running:
+            try:
+                self.subscription = self.connect("subscribe")
+                if not self.cameras:
+                    self.cameras = [RemoteCamera(c["id"], self.quality) for c in self.call("describe_cameras")]
+                self.connected = True
+                while self.running:
+                    kind, key, value = self.subscription.recv()
+                    if kind == "frame":
+                        camera = self.get_camera(key)
+                        if camera is not None:
+                            camera.broadcaster.publish(value)
+                    elif kind == "stats":
+                        for camera in self.cameras:
+                            camera.stats = value["cameras"].get(str(camera.id), camera.stats)
+                        self.stats = value
+                        self.stats_broadcaster.publish(value)
+            except (OSError, EOFError, ConnectionError):
+                pass
+            self.connected = False
+            if self.subscription is not None:
+                self.subscription.close()
+            time.sleep(1)
+
+    def watch_loop(self, interval=0.5, refresh=5.0):
+        """Tell the daemon how many viewers each camera has here, on change and periodically."""
+        sent, last = None, 0
+        while self.running:
+            counts = {str(c.id): c.broadcaster.subscribers for c in self.cameras}
+            if counts != sent or time.time() - last >= refresh:
+                try:
+                    self.call("watching", counts)
+                    sent, last = counts, time.time()
+                except (ConnectionError, RuntimeError, TimeoutError):
+                    sent = None
+            time.sleep(interval)
+
+    @property
+    def camera(self):
+        return self.cameras[0] if self.cameras else None
+
+    def get_camera(self, camera_id=None):
+        if camera_id is None:
+            return self.camera
+        for camera in self.cameras:
+            if str(camera.id) == str(camera_id):
+                return camera
+        return None
+
+    def readiness(self):
+        try:
+            status = self.call("readiness")
+        except (ConnectionError, TimeoutError) as e:
+            return {"ready": False, "daemon": "unavailable", "error": str(e)}
+        return {**status, "ready": status["ready"] and self.connected, "daemon": "connected"}
+
+    def describe_cameras(self):
+        return self.call("describe_cameras")
+
+    def switch_video(self, video_path, camera_id=None, resume=False):
+        return self.call("switch_video", video_path, camera_id, resume)
+
+    def update_settings(self, sensitivity, detect_every=None):
+        return self.call("update_settings", sensitivity, detect_every)
+
+    def run_auto_discovery(self, camera_id=None, refresh=False):
+        return self.call("run_auto_discovery", camera_id, refresh)
+
+    def metrics_text(self):
+        # This worker's own stages (e.g. re-encoding for scaled streams) under a separate prefix
+        return self.call("metrics_text") + metrics.prometheus("parking_web")
+
+    def metrics_snapshot(self):
+        return {**self.call("metrics_snapshot"), "web_worker": metrics.snapshot()}
+
+    def profile(self, seconds):
+        return self.call("profile", seconds, timeout=seconds + self.timeout)
@@ -1,19 +1,42 @@
 import cv2
 import numpy as np
-from ultralytics import YOLO
 import json
 import os
+from src.slot_index import SlotIndex
+from src.motion import MotionGate
+from src.roi import RoiTiler, detect_boxes
+from src.tracker import BoxTracker
+from src.backends import load_backend
+from src.overlay import SlotOverlay
 
 class ParkingDetector:
-    def __init__(self, model_path='yolov8n.pt', slots_path='data/slots.json'):
-        self.model = YOLO(model_path)
+    def __init__(self, model_path='yolov8n.pt', slots_path='data/slots.json', min_overlap=None,
+                 motion_gate=True, tile_size=None, imgsz=640, detect_every=1, backend="auto", int8=False,
+                 sources=()):
+        # `sources` are the videos used for warm-up and INT8 calibration
+        self.model, self.backend = load_backend(model_path, backend, imgsz, int8, sources)
         self.slots_path = slots_path
         self.slots = []
+        self.slot_index = None
+        # None: a slot is occupied when a vehicle centre falls inside it.
+        # A ratio: occupied when vehicle boxes cover at least that share of the slot.
+        self.min_overlap = min_overlap
+        # Skips YOLO on frames where no slot region changed
+        self.motion_gate = MotionGate() if motion_gate else None
+        # YOLO only sees the slot area, optionally split into tiles of tile_size pixels
+        self.roi = None
+        self.tile_size = tile_size
+        self.imgsz = imgsz
+        # Full detection every detect_every frames; boxes are tracked by optical flow in between
+        self.tracker = BoxTracker(detect_every)
+        self.overlay = SlotOverlay(font_scale=0.5, label_offset=10,
+                                   label=lambda i, occupied: f"Slot {i+1}: {'Occupied' if occupied else 'Vacant'}")
         self.load_slots()
         
         # Classes for vehicles in COCO dataset
         # 2: car, 3: motorcycle, 5: bus, 7: truck
         self.vehicle_classes = [2, 3, 5, 7]
+        self.conf_threshold = 0.3
 
     def load_slots(self):
         if os.path.exists(self.slots_path):
@@ -24,53 +47,56 @@ class ParkingDetector:
             print(f"Warning: Slots file {self.slots_path} not found.")
 
     def check_occupancy(self, frame, detections):
-        occupancy = [False] * len(self.slots)
-        
-        for i, slot in enumerate(self.slots):
-            slot_poly = np.array(slot, np.int32)
-            
-            for det in detections:
-                # det is [x1, y1, x2, y2, conf, cls]
-                x1, y1, x2, y2 = det[:4]
-                center_x = (x1 + x2) / 2
-                center_y = (y1 + y2) / 2
-                
-                # Check if center of vehicle is inside the slot polygon
-                if cv2.pointPolygonTest(slot_poly, (center_x, center_y), False) >= 0:
-                    occupancy[i] = True
-                    break
-        
-        return occupancy
+        # det is [x1, y1, x2, y2, conf, cls]; the index is rebuilt only when slots or frame size change
+        self.slot_index = SlotIndex.ensure(self.slot_index, self.slots, frame.shape)
+        return self.slot_index.occupancy([det[:4] for det in detections], self.min_overlap)
+
+    def needs_inference(self, frame, occupancy, now=None):
+        if self.motion_gate is None:
+            return True
+        self.slot_index = SlotIndex.ensure(self.slot_index, self.slots, frame.shape)
+        return self.motion_gate.should_infer(frame, self.slot_index, force=occupancy is None, now=now)
+
+    def detections(self, frames):
+        """Run YOLO on a batch of frames and return the vehicle boxes of each frame."""
+        tilers = []
+        for frame in frames:
+            self.roi = RoiTiler.ensure(self.roi, self.slots, frame.shape, self.tile_size)
+            tilers.append(self.roi)
+        results = []
+        for boxes in detect_boxes(self.model, frames, tilers, verbose=False, imgsz=self.imgsz):
+            keep = np.isin(boxes[:, 5].astype(int), self.vehicle_classes) & (boxes[:, 4] > self.conf_threshold)
+            results.append(boxes[keep])
+        return results
+
+    def analyze(self, frames):
+        """Run YOLO on a batch of frames and return one occupancy list per frame."""
+        return [self.check_occupancy(frame, boxes) for frame, boxes in zip(frames, self.detections(frames))]
+
+    def track(self, frame, occupancy):
+        """Occupancy of one frame in a sequence, detecting only when the tracker asks for it."""
+        changed = self.motion_gate.changed if self.motion_gate is not None else None
+        if self.tracker.due(changed, occupancy):
+            boxes = self.tracker.update(frame, self.detections([frame])[0])
+        else:
+            boxes = self.tracker.propagate(frame)
+        return self.check_occupancy(frame, boxes)
 
     def detect(self, video_path):
         cap = cv2.VideoCapture(video_path)
+        occupancy = None
         
         while cap.isOpened():
             success, frame = cap.read()
             if not success:
                 break
-                
-            results = self.model(frame, verbose=False)[0]
-            detections = []
-            
-            for r in results.boxes.data.tolist():
-                x1, y1, x2, y2, conf, cls = r
-                if int(cls) in self.vehicle_classes and conf > 0.3:
-                    detections.append([x1, y1, x2, y2, conf, cls])
-            
-            occupancy = self.check_occupancy(frame, detections)
+
+            # Unchanged slots carry their previous occupancy forward
+            if self.needs_inference(frame, occupancy):
+                occupancy = self.track(frame, occupancy)
             
             # Draw slots
-            for i, slot in enumerate(self.slots):
-                color = (0, 0, 255) if occupancy[i] else (0, 255, 0)
-                slot_poly = np.array(slot, np.int32)
-                cv2.polylines(frame, [slot_poly], True, color, 2)
-                
-                # Label
-                status = "Occupied" if occupancy[i] else "Vacant"
-                cv2.putText(frame, f"Slot {i+1}: {status}", 
-                            (slot[0][0], slot[0][1] - 10),
-                            cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 1)
+            self.overlay.draw(frame, self.slots, occupancy)
 
             # Draw summary
             vacant_count = occupancy.count(False)
@@ -84,6 +110,8 @@ class ParkingDetector:
                 
         cap.release()
         cv2.destroyAllWindows()
+        if self.motion_gate is not None:
+            print(f"Skipped inference on {self.motion_gate.skip_ratio:.0%} of frames.")
 
 if __name__ == "__main__":
     # detector = ParkingDetector()
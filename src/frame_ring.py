@@ -0,0 +1,139 @@
+import threading
+import weakref
+from multiprocessing import shared_memory
+import numpy as np
+
+# Ring header (int64): newest complete frame number, its slot
+HEAD_FIELDS = 2
+# Per-slot header (int64): frame number (-1 while being written), generation, frame index (-1 for live
+# sources), height, width
+SLOT_FIELDS = 5
+
+class Pin:
+    """Base object of an acquired frame view.
+
+    NumPy points every view of a view at the first base that is not an
+    array, so all slices of the frame keep this object, and with it the
+    slot's pin, alive.
+    """
+
+    def __init__(self, view):
+        self.view = view
+        self.__array_interface__ = view.__array_interface__
+
+class FrameRing:
+    """Fixed-size frame slots in shared memory, filled by one writer process and mapped by readers without copying.
+
+    A slot's stamp is -1 while it is being written and the frame number once
+    the frame is complete, seqlock style. Readers pin the slots whose frames
+    they still use: `acquire` returns a view that holds its pin until the
+    last reference to it is gone, and the writer skips pinned slots, dropping
+    the frame if every slot is pinned. A frame that readers acquire is
+    therefore never overwritten while it is in use.
+    """
+
+    def __init__(self, shm, slots, height, width, channels=3, owner=False):
+        self.shm = shm
+        self.slots = slots
+        self.shape = (height, width, channels)
+        self.owner = owner
+        header = HEAD_FIELDS + slots * (1 + SLOT_FIELDS)
+        self.header = np.ndarray((header,), np.int64, shm.buf)
+        self.pins = self.header[HEAD_FIELDS:HEAD_FIELDS + slots]
+        self.meta = self.header[HEAD_FIELDS + slots:].reshape(slots, SLOT_FIELDS)
+        # Flat slots so every frame view, whatever its size, is contiguous
+        self.data = np.ndarray((slots, height * width * channels), np.uint8, shm.buf, header * 8)
+        # Pins are only changed by the reading process, from any of its threads
+        self.pin_lock = threading.RLock()
+
+    @classmethod
+    def create(cls, slots, height, width, channels=3):
+        size = (HEAD_FIELDS + slots * (1 + SLOT_FIELDS)) * 8 + slots * height * width * channels
+        ring = cls(shared_memory.SharedMemory(create=True, size=size), slots, height, width, channels, owner=True)
+        ring.header[:] = 0
+        ring.header[1] = -1
+        ring.meta[:, 0] = -1
+        return ring
+
+    @classmethod
+    def attach(cls, spec):
+        """Map a ring created in another process from its `spec`."""
+        name, slots, height, width, channels = spec
+        return cls(shared_memory.SharedMemory(name=name), slots, height, width, channels)
+
+    @property
+    def spec(self):
+        return (self.shm.name, self.slots) + self.shape
+
+    @property
+    def head(self):
+        """(frame number, slot) of the newest complete frame; number 0 before the first."""
+        return int(self.header[0]), int(self.header[1])
+
+    def fits(self, shape):
+        return (shape[0] <= self.shape[0] and shape[1] <= self.shape[1]
+                and (shape[2] if len(shape) > 2 else 1) == self.shape[2])
+
+    def write(self, frame, generation=0, index=None):
+        """Copy `frame` into the next unpinned slot; returns (number, slot), or None when all slots are pinned."""
+        number, last = self.head
+        number += 1
+        height, width = frame.shape[:2]
+        for offset in range(1, self.slots + 1):
+            slot = (last + offset) % self.slots
+            meta = self.meta[slot]
+            previous = int(meta[0])
+            # Mark the slot first, then look for a pin: a reader pins first, then checks the stamp
+            meta[0] = -1
+            if self.pins[slot]:
+                meta[0] = previous
+                continue
+            self.data[slot, :frame.size].reshape(frame.shape)[...] = frame
+            meta[1:] = generation, -1 if index is None else index, height, width
+            meta[0] = number
+            self.header[0], self.header[1] = number, slot
+            return number, slot
+        return None
+
+    def read(self, slot, number):
+        """(generation, index, frame view) of frame `number` in `slot`, or None when the slot was reused."""
+        stamp, generation, index, height, width = (int(v) for v in self.meta[slot])
+        if stamp != number:
+            return None
+        frame = self.data[slot, :height * width * self.shape[2]].reshape(height, width, self.shape[2])
+        return generation, None if index < 0 else index, frame
+
+    def valid(self, slot, number):
+        return int(self.meta[slot, 0]) == number
+
+    def acquire(self, slot, number):
+        """Like `read`, but the slot stays pinned until the returned frame view is garbage collected."""
+        with self.pin_lock:
+            self.pins[slot] += 1
+        item = self.read(slot, number)
+        if item is None:
+            self.release(slot)
+            return None
+        generation, index, view = item
+        pin = Pin(view)
+        weakref.finalize(pin, self.release, slot)
+        return generation, index, np.asarray(pin)
+
+    def release(self, slot):
+        with self.pin_lock:
+            if self.pins is not None:
+                self.pins[slot] -= 1
+
+    @property
+    def pinned(self):
+        with self.pin_lock:
+            return int(self.pins.sum()) if self.pins is not None else 0
+
+    def close(self):
+        self.header = self.pins = self.meta = self.data = None
+        if self.owner:
+            self.shm.unlink()
+        try:
+            self.shm.close()
+        except BufferError:
+            pass # Frame views are still referenced; the mapping goes away with them
@@ -0,0 +1,47 @@
+import hashlib
+import os
+import threading
+import cv2
+import numpy as np
+
+_digests = {}
+_digests_lock = threading.Lock()
+
+def file_digest(path, chunk_size=1 << 20):
+    """SHA-256 of a file's content, memoized by path, size and modification time."""
+    stat = os.stat(path)
+    key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    with _digests_lock:
+        if key in _digests:
+            return _digests[key]
+
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    value = digest.hexdigest()
+    with _digests_lock:
+        _digests[key] = value
+    return value
+
+def remember_digest(path, value):
+    """Record a digest computed elsewhere (e.g. while the file was being uploaded)."""
+    stat = os.stat(path)
+    with _digests_lock:
+        _digests[(os.path.abspath(path), stat.st_size, stat.st_mtime_ns)] = value
+
+def source_digest(source):
+    """Content digest for file sources; None for cameras and streams."""
+    if isinstance(source, str) and os.path.isfile(source):
+        return file_digest(source)
+    return None
+
+def frame_hash(frame):
+    """64-bit difference hash of a frame as 16 hex digits; similar frames differ in few bits."""
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+    small = cv2.resize(gray, (9, 8), interpolation=cv2.INTER_AREA)
+    bits = (small[:, 1:] > small[:, :-1]).ravel()
+    return f"{int(np.packbits(bits).view('>u8')[0]):016x}"
+
+def hamming(a, b):
+    return bin(int(a, 16) ^ int(b, 16)).count("1")
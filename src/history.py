@@ -0,0 +1,274 @@
+import os
+import threading
+import time
+import numpy as np
+
+EVENT_COLUMNS = {"ts": np.float64, "camera": np.uint16, "slot": np.uint32, "state": np.uint8}
+MINUTE_COLUMNS = {"ts": np.float64, "camera": np.uint16, "occupied": np.float32, "total": np.uint32}
+
+class ColumnStore:
+    """Append-only table kept as one flat binary file per column.
+
+    New rows go into fixed-size in-memory arrays; when those fill up (or on
+    flush) they are appended to the column files, which are read back through
+    np.memmap. Rows are appended in time order, so range queries are a binary
+    search on the `ts` column and RAM use stays bounded by the buffer size.
+    """
+
+    def __init__(self, directory, name, columns, capacity=4096):
+        self.columns = columns
+        self.capacity = capacity
+        self.paths = {c: os.path.join(directory, f"{name}.{c}.bin") for c in columns}
+        self.buffers = {c: np.empty(capacity, dtype) for c, dtype in columns.items()}
+        self.size = 0
+        self.maps = {}
+        self.disk_rows = self.count_disk_rows()
+
+    def count_disk_rows(self):
+        # The shortest column wins, so a row half-written before a crash is ignored
+        rows = [os.path.getsize(p) // np.dtype(self.columns[c]).itemsize if os.path.exists(p) else 0
+                for c, p in self.paths.items()]
+        return min(rows)
+
+    def append(self, rows):
+        """Append rows given as a dict of equal-length column arrays."""
+        count = len(rows["ts"])
+        offset = 0
+        while offset < count:
+            take = min(count - offset, self.capacity - self.size)
+            for c in self.columns:
+                self.buffers[c][self.size:self.size + take] = rows[c][offset:offset + take]
+            self.size += take
+            offset += take
+            if self.size == self.capacity:
+                self.flush()
+
+    def flush(self):
+        if self.size == 0:
+            return
+        for c, path in self.paths.items():
+            with open(path, "ab") as f:
+                # Truncate any partial tail first so every column stays row-aligned
+                f.truncate(self.disk_rows * self.buffers[c].itemsize)
+                self.buffers[c][:self.size].tofile(f)
+        self.disk_rows += self.size
+        self.size = 0
+        self.maps = {}
+
+    def disk_column(self, c):
+        if self.disk_rows == 0:
+            return np.empty(0, self.columns[c])
+        if c not in self.maps:
+            self.maps[c] = np.memmap(self.paths[c], dtype=self.columns[c], mode="r", shape=(self.disk_rows,))
+        return self.maps[c]
+
+    def first_ts(self):
+        """Timestamp of the oldest row, or None while the store is empty."""
+        if self.disk_rows:
+            return float(self.disk_column("ts")[0])
+        return float(self.buffers["ts"][0]) if self.size else None
+
+    def range(self, start, end):
+        """Rows with start <= ts < end as a dict of column arrays."""
+        disk_ts = self.disk_column("ts")
+        mem_ts = self.buffers["ts"][:self.size]
+        d0, d1 = np.searchsorted(disk_ts, [start, end])
+        m0, m1 = np.searchsorted(mem_ts, [start, end])
+        return {c: np.concatenate([self.disk_column(c)[d0:d1], self.buffers[c][m0:m1]]) for c in self.columns}
+
+class OccupancyHistory:
+    """Per-slot occupancy change events plus per-minute occupancy aggregates.
+
+    `record` is called with each camera's occupancy as it is published and
+    only stores slots whose state flipped, so a static lot costs nothing.
+    Both tables must stay in `ts` order for the range searches: a timestamp
+    older than one already recorded (another camera's thread got the lock
+    first) is moved up to it, and every camera's minute closes when the
+    first camera reaches the next minute, not when that camera records again.
+    """
+
+    def __init__(self, directory="data/history", capacity=4096, flush_interval=60):
+        os.makedirs(directory, exist_ok=True)
+        self.events = ColumnStore(directory, "events", EVENT_COLUMNS, capacity)
+        self.minutes = ColumnStore(directory, "minutes", MINUTE_COLUMNS, capacity)
+        self.flush_interval = flush_interval
+        self.last_flush = time.time()
+        self.lock = threading.Lock()
+        self.last_state = {}
+        # camera -> [minute, occupied sum, sample count, total slots]
+        self.minute_acc = {}
+        self.last_ts = 0.0
+
+    def record(self, camera_id, occupancy, ts=None):
+        ts = time.time() if ts is None else ts
+        state = np.asarray(occupancy, bool)
+        with self.lock:
+            ts = self.last_ts = max(ts, self.last_ts)
+            previous = self.last_state.get(camera_id)
+            if previous is None or len(previous) != len(state):
+                # New layout: every occupied slot starts a new interval
+                previous = np.zeros(len(state), bool)
+            changed = np.flatnonzero(previous != state)
+            if len(changed):
+                self.events.append({
+                    "ts": np.full(len(changed), ts),
+                    "camera": np.full(len(changed), camera_id),
+                    "slot": changed,
+                    "state": state[changed],
+                })
+            self.last_state[camera_id] = state
+            self.accumulate_minute(camera_id, ts, int(state.sum()), len(state))
+
+            if ts - self.last_flush >= self.flush_interval:
+                self.flush_locked()
+                self.last_flush = ts
+
+    def close_minutes(self, before=None):
+        """Append the rows of open minutes older than `before` (all of them when None)."""
+        closed = [(camera_id, acc) for camera_id, acc in self.minute_acc.items() if before is None or acc[0] < before]
+        if not closed:
+            return
+        closed.sort(key=lambda item: item[1][0])
+        self.minutes.append({
+            "ts": np.array([acc[0] * 60.0 for _, acc in closed]),
+            "camera": np.array([camera_id for camera_id, _ in closed]),
+            "occupied": np.array([acc[1] / acc[2] for _, acc in closed]),
+            "total": np.array([acc[3] for _, acc in closed]),
+        })
+        for camera_id, _ in closed:
+            del self.minute_acc[camera_id]
+
+    def accumulate_minute(self, camera_id, ts, occupied, total):
+        minute = int(ts // 60)
+        self.close_minutes(minute)
+        acc = self.minute_acc.get(camera_id)
+        if acc is None:
+            acc = [minute, 0, 0, total]
+            self.minute_acc[camera_id] = acc
+        acc[1] += occupied
+        acc[2] += 1
+        acc[3] = total
+
+    def flush_locked(self):
+        self.events.flush()
+        self.minutes.flush()
+
+    def flush(self):
+        """Write everything, including the minutes still open; called on shutdown."""
+        with self.lock:
+            self.close_minutes()
+            self.flush_locked()
+
+    def select(self, store, start, end, camera=None):
+        with self.lock:
+            rows = store.range(start, end)
+        if camera is not None:
+            keep = rows["camera"] == int(camera)
+            rows = {c: v[keep] for c, v in rows.items()}
+        return rows
+
+    def range(self, start, end, camera=None, slot=None, limit=10000):
+        """Raw state-change events in [start, end)."""
+        rows = self.select(self.events, start, end, camera)
+        if slot is not None:
+            keep = rows["slot"] == int(slot)
+            rows = {c: v[keep] for c, v in rows.items()}
+        return [{"ts": float(t), "camera": int(c), "slot": int(s), "occupied": bool(o)}
+                for t, c, s, o in zip(rows["ts"][-limit:], rows["camera"][-limit:],
+                                      rows["slot"][-limit:], rows["state"][-limit:])]
+
+    def downsample(self, start, end, bucket=3600, camera=None):
+        """Mean occupied slots and utilization per `bucket` seconds, summed over cameras.
+
+        Buckets are aligned to multiples of `bucket` since the epoch, so hourly
+        buckets match clock hours whatever `start` is.
+        """
+        rows = self.select(self.minutes, start, end, camera)
+        if len(rows["ts"]) == 0:
+            return []
+        buckets = (rows["ts"] // bucket).astype(np.int64)
+        minutes = (rows["ts"] // 60).astype(np.int64)
+        # A camera's minute written twice (its open minute at shutdown, then again after a quick restart)
+        # is averaged, not counted twice
+        keys, inverse = np.unique(np.stack([buckets, minutes, rows["camera"].astype(np.int64)]), axis=1,
+                                  return_inverse=True)
+        inverse = inverse.ravel()
+        counts = np.bincount(inverse)
+        occupied = np.bincount(inverse, weights=rows["occupied"]) / counts
+        total = np.bincount(inverse, weights=rows["total"]) / counts
+        # Sum cameras within a minute, then average those minutes within the bucket
+        keys, inverse = np.unique(keys[:2], axis=1, return_inverse=True)
+        inverse = inverse.ravel()
+        occupied = np.bincount(inverse, weights=occupied)
+        total = np.bincount(inverse, weights=total)
+        bucket_ids, minute_bucket = np.unique(keys[0], return_inverse=True)
+        minute_bucket = minute_bucket.ravel()
+        counts = np.bincount(minute_bucket)
+        mean_occupied = np.bincount(minute_bucket, weights=occupied) / counts
+        mean_total = np.bincount(minute_bucket, weights=total) / counts
+        return [{"ts": float(b * bucket), "occupied": round(float(o), 2), "total": round(float(t), 2),
+                 "utilization": round(float(o / t * 100) if t else 0.0, 1)}
+                for b, o, t in zip(bucket_ids, mean_occupied, mean_total)]
+
+    def dwell(self, start, end, camera=None, slot=None):
+        """Occupied-interval statistics per slot for intervals that end within [start, end).
+
+        A stay that began before `start` is looked up in earlier events, so
+        long stays are not left out.
+        """
+        rows = self.select(self.events, start, end, camera)
+        if slot is not None:
+            keep = rows["slot"] == int(slot)
+            rows = {c: v[keep] for c, v in rows.items()}
+        rows = self.with_openings(rows, start, camera)
+        if len(rows["ts"]) < 2:
+            return []
+        order = np.lexsort((rows["ts"], rows["slot"], rows["camera"]))
+        ts, cams, slots, states = (rows[c][order] for c in ("ts", "camera", "slot", "state"))
+        # An interval is an "occupied" event followed by a "vacant" event for the same slot
+        closes = ((cams[:-1] == cams[1:]) & (slots[:-1] == slots[1:]) &
+                  (states[:-1] == 1) & (states[1:] == 0))
+        idx = np.flatnonzero(closes)
+        if len(idx) == 0:
+            return []
+        durations = ts[idx + 1] - ts[idx]
+        keys, inverse = np.unique(np.stack([cams[idx].astype(np.int64), slots[idx].astype(np.int64)]), axis=1,
+                                  return_inverse=True)
+        inverse = inverse.ravel()
+        counts = np.bincount(inverse)
+        totals = np.bincount(inverse, weights=durations)
+        longest = np.zeros(len(counts))
+        np.maximum.at(longest, inverse, durations)
+        return [{"camera": int(c), "slot": int(s), "count": int(n), "mean": round(float(t / n), 1),
+                 "max": round(float(m), 1), "total": round(float(t), 1)}
+                for (c, s), n, t, m in zip(keys.T, counts, totals, longest)]
+
+    def with_openings(self, rows, start, camera=None, window=3600.0):
+        """`rows` plus, for each slot whose first event is a vacancy, the occupied event that opened its stay.
+
+        Looks back over doubling windows before `start` until every such slot
+        has an earlier event or the history runs out.
+        """
+        def slot_keys(part):
+            return part["camera"].astype(np.int64) << 32 | part["slot"].astype(np.int64)
+
+        keys, first = np.unique(slot_keys(rows), return_index=True)
+        pending = keys[rows["state"][first] == 0]
+        with self.lock:
+            oldest = self.events.first_ts()
+        found = []
+        while len(pending) and oldest is not None and start > oldest:
+            earlier = self.select(self.events, start - window, start, camera)
+            # The last event before `start` decides how each slot entered the range
+            keys, last = np.unique(slot_keys(earlier)[::-1], return_index=True)
+            last = len(earlier["ts"]) - 1 - last
+            hit = np.isin(keys, pending)
+            pending = np.setdiff1d(pending, keys[hit])
+            opening = last[hit][earlier["state"][last[hit]] == 1]
+            found.append({c: v[opening] for c, v in earlier.items()})
+            if start - window <= oldest:
+                break
+            window *= 2
+        if not found:
+            return rows
+        return {c: np.concatenate([part[c] for part in found] + [rows[c]]) for c in rows}
@@ -0,0 +1,189 @@
+import collections
+import sys
+import threading
+import time
+from contextlib import contextmanager
+import numpy as np
+
+QUANTILES = (0.5, 0.95, 0.99)
+
+class Histogram:
+    """Rolling window of the latest observations plus lifetime count and sum."""
+
+    def __init__(self, window=1024):
+        self.values = collections.deque(maxlen=window)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.values.append(value)
+        self.count += 1
+        self.sum += value
+
+    def quantiles(self):
+        if not self.values:
+            return {q: 0.0 for q in QUANTILES}
+        points = np.quantile(np.fromiter(self.values, float, len(self.values)), QUANTILES)
+        return dict(zip(QUANTILES, points.tolist()))
+
+class Rate:
+    """Events per second over the last `window` seconds."""
+
+    def __init__(self, window=10.0):
+        self.window = window
+        self.times = collections.deque()
+
+    def mark(self, n=1, now=None):
+        now = time.time() if now is None else now
+        self.times.extend([now] * n)
+        self.trim(now)
+
+    def trim(self, now):
+        while self.times and self.times[0] < now - self.window:
+            self.times.popleft()
+
+    def value(self):
+        now = time.time()
+        self.trim(now)
+        return len(self.times) / self.window
+
+class Metrics:
+    """Hot-path instrumentation: stage timers, counters, rates and sampled gauges."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.stages = collections.defaultdict(Histogram)
+        self.counters = collections.defaultdict(int)
+        self.rates = collections.defaultdict(Rate)
+        self.gauges = {}
+
+    def observe(self, stage, seconds):
+        with self.lock:
+            self.stages[stage].observe(seconds)
+
+    @contextmanager
+    def timer(self, stage):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - started)
+
+    def incr(self, name, n=1):
+        with self.lock:
+            self.counters[name] += n
+
+    def mark(self, name, n=1):
+        with self.lock:
+            self.rates[name].mark(n)
+
+    def gauge(self, name, fn):
+        """Register a callable sampled whenever metrics are read."""
+        self.gauges[name] = fn
+
+    def snapshot(self):
+        with self.lock:
+            stages = {name: {"count": h.count, "sum": round(h.sum, 6),
+                             **{f"p{int(q * 100)}": round(v * 1000, 3) for q, v in h.quantiles().items()}}
+                      for name, h in self.stages.items()}
+            counters = dict(self.counters)
+            rates = {name: round(r.value(), 2) for name, r in self.rates.items()}
+        gauges = {}
+        for name, fn in list(self.gauges.items()):
+            try:
+                gauges[name] = fn()
+            except Exception:
+                gauges[name] = None
+        # Stage percentiles are reported in milliseconds
+        return {"stages_ms": stages, "counters": counters, "rates_per_s": rates, "gauges": gauges}
+
+    def prometheus(self, prefix="parking"):
+        """Render the metrics in the Prometheus text exposition format."""
+        lines = [f"# TYPE {prefix}_stage_seconds summary"]
+        with self.lock:
+            for name, h in sorted(self.stages.items()):
+                for q, v in h.quantiles().items():
+                    lines.append(f'{prefix}_stage_seconds{{stage="{name}",quantile="{q}"}} {v:.6f}')
+                lines.append(f'{prefix}_stage_seconds_count{{stage="{name}"}} {h.count}')
+                lines.append(f'{prefix}_stage_seconds_sum{{stage="{name}"}} {h.sum:.6f}')
+            for name, value in sorted(self.counters.items()):
+                lines.append(f"# TYPE {prefix}_{name}_total counter")
+                lines.append(f"{prefix}_{name}_total {value}")
+            for name, r in sorted(self.rates.items()):
+                lines.append(f"# TYPE {prefix}_{name}_per_second gauge")
+                lines.append(f"{prefix}_{name}_per_second {r.value():.3f}")
+        for name, fn in sorted(self.gauges.items()):
+            try:
+                value = float(fn())
+            except Exception:
+                continue
+            lines.append(f"# TYPE {prefix}_{name} gauge")
+            lines.append(f"{prefix}_{name} {value}")
+        return "\n".join(lines) + "\n"
+
+class InstrumentedLock:
+    """threading.Lock that records how long callers waited to acquire it."""
+
+    def __init__(self, name, registry):
+        self.lock = threading.Lock()
+        self.name = name
+        self.registry = registry
+
+    def acquire(self, *args, **kwargs):
+        started = time.perf_counter()
+        acquired = self.lock.acquire(*args, **kwargs)
+        waited = time.perf_counter() - started
+        self.registry.observe(f"{self.name}_wait", waited)
+        if waited > 0.001:
+            self.registry.incr(f"{self.name}_contended")
+        return acquired
+
+    def release(self):
+        self.lock.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+def sample_profile(seconds, interval=0.005, top=30):
+    """Statistical profile of every thread: samples all stacks every `interval` for `seconds`.
+
+    Returns the functions most often on top of a stack ("self") and anywhere
+    on it ("total"), as a share of samples.
+    """
+    me = threading.get_ident()
+    names = {t.ident: t.name for t in threading.enumerate()}
+    own = collections.Counter()
+    total = collections.Counter()
+    threads = collections.Counter()
+    samples = 0
+    deadline = time.time() + seconds
+    while time.time() < deadline:
+        for ident, frame in sys._current_frames().items():
+            if ident == me:
+                continue
+            samples += 1
+            threads[names.get(ident, str(ident))] += 1
+            seen = set()
+            leaf = True
+            while frame is not None:
+                code = frame.f_code
+                key = f"{code.co_name} ({code.co_filename}:{code.co_firstlineno})"
+                if leaf:
+                    own[key] += 1
+                    leaf = False
+                if key not in seen:
+                    total[key] += 1
+                    seen.add(key)
+                frame = frame.f_back
+        time.sleep(interval)
+
+    def share(counter):
+        return [{"function": k, "share": round(v / max(1, samples), 4)} for k, v in counter.most_common(top)]
+
+    return {"seconds": seconds, "samples": samples, "threads": dict(threads), "self": share(own), "total": share(total)}
+
+metrics = Metrics()
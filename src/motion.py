@@ -0,0 +1,77 @@
+import time
+import cv2
+import numpy as np
+
+class MotionGate:
+    """Skips inference while the slot regions of a camera stay static.
+
+    Each frame is reduced to a small blurred grayscale image and compared with
+    the one taken at the last inference. Inference is requested only when the
+    mean change inside some slot exceeds `threshold` (grey levels) or when the
+    last inference is older than `max_staleness` seconds.
+    """
+
+    def __init__(self, threshold=8.0, max_staleness=5.0, width=160):
+        self.threshold = threshold
+        self.max_staleness = max_staleness
+        self.width = width
+        self.reference = None
+        self.last_inference = 0
+        self.slot_index = None
+        self.small_labels = None
+        self.checked = 0
+        self.skipped = 0
+        # Per-slot mask of the slots that changed on the last checked frame (None: unknown)
+        self.changed = None
+
+    @property
+    def skip_ratio(self):
+        return round(self.skipped / self.checked, 3) if self.checked else 0.0
+
+    def reset(self):
+        """Force the next frame through inference, e.g. after the source changed."""
+        self.reference = None
+
+    def prepare(self, frame):
+        h, w = frame.shape[:2]
+        size = (self.width, max(1, int(h * self.width / w)))
+        gray = cv2.cvtColor(cv2.resize(frame, size, interpolation=cv2.INTER_AREA), cv2.COLOR_BGR2GRAY)
+        return cv2.GaussianBlur(gray, (5, 5), 0)
+
+    def labels_for(self, slot_index, size):
+        if slot_index is not self.slot_index or self.small_labels is None or self.small_labels.shape != size[::-1]:
+            self.slot_index = slot_index
+            self.small_labels = None
+            if slot_index is not None and slot_index.count:
+                self.small_labels = cv2.resize(slot_index.labels, size, interpolation=cv2.INTER_NEAREST)
+            # A new layout invalidates the carried-forward occupancy
+            self.reference = None
+        return self.small_labels
+
+    def changed_slots(self, small, labels):
+        diff = cv2.absdiff(small, self.reference)
+        if labels is None:
+            return diff.mean() > self.threshold
+        counts = np.bincount(labels.ravel(), minlength=self.slot_index.count + 1)
+        sums = np.bincount(labels.ravel(), weights=diff.ravel(), minlength=self.slot_index.count + 1)
+        means = sums[1:] / np.maximum(counts[1:], 1)
+        self.changed = means > self.threshold
+        return bool(np.any(self.changed))
+
+    def should_infer(self, frame, slot_index=None, force=False, now=None):
+        """True when `frame` needs a fresh inference; records it as the new reference if so."""
+        now = time.time() if now is None else now
+        small = self.prepare(frame)
+        labels = self.labels_for(slot_index, small.shape[::-1])
+        self.checked += 1
+        self.changed = None
+
+        if (not force and self.reference is not None and self.reference.shape == small.shape
+                and now - self.last_inference < self.max_staleness
+                and not self.changed_slots(small, labels)):
+            self.skipped += 1
+            return False
+
+        self.reference = small
+        self.last_inference = now
+        return True
@@ -0,0 +1,60 @@
+import cv2
+import numpy as np
+
+OCCUPIED_COLOR = (0, 0, 255)
+VACANT_COLOR = (0, 255, 0)
+
+def slot_number(i, occupied):
+    return str(i + 1)
+
+class SlotOverlay:
+    """Slot outlines and labels rendered once into a color layer plus mask.
+
+    The layers are redrawn only when the slot geometry, the frame size or
+    some slot's occupancy changes; every other frame costs a single masked
+    copy over the bounding box of the drawing.
+    """
+
+    def __init__(self, font_scale=0.4, label_offset=5, label=slot_number):
+        self.font_scale = font_scale
+        self.label_offset = label_offset
+        self.label = label
+        self.slots = None
+        self.occupancy = None
+        self.shape = None
+        self.color = None
+        self.mask = None
+        self.region = None
+
+    def rebuild(self, slots, occupancy, shape):
+        self.slots = slots
+        self.occupancy = list(occupancy)
+        self.shape = shape
+        self.color = np.zeros(shape + (3,), np.uint8)
+        mask = np.zeros(shape, np.uint8)
+        for i, slot in enumerate(slots):
+            color = OCCUPIED_COLOR if occupancy[i] else VACANT_COLOR
+            poly = np.array(slot, np.int32)
+            origin = (int(poly[0][0]), int(poly[0][1] - self.label_offset))
+            text = self.label(i, occupancy[i])
+            for layer, ink in ((self.color, color), (mask, 255)):
+                cv2.polylines(layer, [poly], True, ink, 2)
+                cv2.putText(layer, text, origin, cv2.FONT_HERSHEY_SIMPLEX, self.font_scale, ink, 1)
+
+        # Compositing only touches the area that actually has drawing in it
+        ys, xs = np.nonzero(mask.any(axis=1))[0], np.nonzero(mask.any(axis=0))[0]
+        if len(ys) == 0:
+            self.region = None
+            return
+        self.region = (slice(ys[0], ys[-1] + 1), slice(xs[0], xs[-1] + 1))
+        self.color = self.color[self.region]
+        self.mask = mask[self.region].astype(bool)[..., None]
+
+    def draw(self, frame, slots, occupancy):
+        """Composite the overlay for `slots` in the given occupancy onto `frame` in place."""
+        shape = frame.shape[:2]
+        if slots is not self.slots or shape != self.shape or list(occupancy) != self.occupancy:
+            self.rebuild(slots, occupancy, shape)
+        if self.region is not None:
+            np.copyto(frame[self.region], self.color, where=self.mask)
+        return frame
@@ -0,0 +1,114 @@
+import time
+import cv2
+
+class SampleRate:
+    """Adaptive analysis rate for one source.
+
+    The pipeline reports how long it took to process each sampled frame; the
+    rate follows the resulting throughput with some `headroom`, so the
+    consumer never waits for input while the source is not decoded faster
+    than it can be used. Bounded by [min_rate, max_rate] frames per second.
+    """
+
+    def __init__(self, max_rate=30.0, min_rate=1.0, headroom=1.25, smoothing=0.2):
+        self.max_rate = max_rate
+        self.min_rate = min_rate
+        self.headroom = headroom
+        self.smoothing = smoothing
+        self.service_time = None
+
+    def observe(self, seconds):
+        if self.service_time is None:
+            self.service_time = seconds
+        else:
+            self.service_time += self.smoothing * (seconds - self.service_time)
+
+    @property
+    def rate(self):
+        if not self.service_time:
+            return self.max_rate
+        return min(self.max_rate, max(self.min_rate, self.headroom / self.service_time))
+
+class FrameReader:
+    """Latest-frame-wins access to one cv2.VideoCapture.
+
+    Live sources (webcams, RTSP) are drained with `drain`, a grab() per
+    delivered frame, so OpenCV's buffer never holds stale frames; `sample`
+    decodes only the newest one. Files play back in real time: `sample`
+    jumps to the frame matching the wall-clock time since playback started,
+    passing over the frames in between with grab(), or seeking when more
+    than `seek_after` frames would be skipped. With `snap`, the file position
+    moves to a nearby frame the caller prefers (e.g. one with cached results),
+    within `snap_window` frames of real time and never backwards.
+    """
+
+    def __init__(self, cap, live, fps=0, seek_after=None):
+        self.cap = cap
+        self.live = live
+        self.fps = fps if fps and fps > 0 else 25.0
+        self.seek_after = seek_after or int(self.fps * 2)
+        self.snap_window = max(1, int(self.fps / 2))
+        self.position = 0 if live else int(cap.get(cv2.CAP_PROP_POS_FRAMES))
+        self.frame_count = 0 if live else int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        self.anchor = (time.time(), self.position)
+        self.grabbed = False
+        # Index of the last sampled frame within a file; None for live sources
+        self.index = None
+        self.decoded = 0
+        self.skipped = 0
+
+    def drain(self):
+        """Live sources: take the next frame off the stream without decoding it. False when the source failed."""
+        if self.grabbed:
+            self.skipped += 1
+        self.grabbed = self.cap.grab()
+        return self.grabbed
+
+    def rewind(self, now):
+        self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+        self.position = 0
+        self.anchor = (now, 0)
+
+    def sample(self, now=None, snap=None):
+        """Decode the frame to analyze now, or None when the source has none.
+
+        `snap(target, low, high)` may return a preferred frame index within
+        [low, high] for files, or None to keep the real-time target.
+        """
+        if self.live:
+            if not self.grabbed and not self.cap.grab():
+                return None
+            self.grabbed = False
+            ok, frame = self.cap.retrieve()
+            self.decoded += ok
+            return frame if ok else None
+
+        now = time.time() if now is None else now
+        target = self.anchor[1] + int((now - self.anchor[0]) * self.fps)
+        if self.frame_count > 0 and target >= self.frame_count:
+            self.rewind(now)
+            target = 0
+        if snap is not None:
+            snapped = snap(target, max(self.position, target - self.snap_window), target + self.snap_window)
+            if snapped is not None:
+                target = snapped
+        gap = target - self.position
+        if gap > self.seek_after:
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, target)
+            self.skipped += gap
+            self.position = target
+        else:
+            while gap > 0 and self.cap.grab():
+                gap -= 1
+                self.skipped += 1
+                self.position += 1
+
+        ok, frame = self.cap.read()
+        if not ok:
+            # End of a file whose length OpenCV could not report: loop
+            self.rewind(now)
+            ok, frame = self.cap.read()
+        self.index = self.position
+        self.position += 1
+        self.decoded += ok
+        return frame if ok else None
@@ -0,0 +1,150 @@
+import collections
+import hashlib
+import json
+import os
+import struct
+import threading
+import time
+import numpy as np
+
+# Record header: frame index, box count; followed by count rows of 6 float32 (x1, y1, x2, y2, conf, cls)
+HEADER = struct.Struct("<IH")
+BOX_BYTES = 6 * 4
+
+class ResultLog:
+    """Detections of one video under one model configuration, by frame index.
+
+    The append-only binary log is kept in memory as one buffer, mirroring the
+    file, plus an array of record offsets by frame index, so a long video
+    costs a few bytes per frame on top of its boxes. Records are appended to
+    the file on `flush`; a record torn by a crash is cut off on the next
+    write.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.buffer = bytearray()
+        # Byte offset of each frame's record in buffer; -1 when the frame has none
+        self.offsets = np.full(0, -1, np.int64)
+        self.count = 0
+        self.flushed = 0
+        # Set once the cache has dropped this log; later writes go straight to disk
+        self.evicted = False
+        self.load()
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "rb") as f:
+            self.buffer = bytearray(f.read())
+        offset = 0
+        while offset + HEADER.size <= len(self.buffer):
+            index, count = HEADER.unpack_from(self.buffer, offset)
+            end = offset + HEADER.size + count * BOX_BYTES
+            if end > len(self.buffer):
+                break
+            self.index(index, offset)
+            offset = end
+        del self.buffer[offset:]
+        self.flushed = offset
+
+    def index(self, index, offset):
+        if index >= len(self.offsets):
+            grown = np.full(max(index + 1, 2 * len(self.offsets), 1024), -1, np.int64)
+            grown[:len(self.offsets)] = self.offsets
+            self.offsets = grown
+        self.count += self.offsets[index] < 0
+        self.offsets[index] = offset
+
+    def __len__(self):
+        return self.count
+
+    def get(self, index):
+        with self.lock:
+            if index >= len(self.offsets) or self.offsets[index] < 0:
+                return None
+            offset = int(self.offsets[index])
+            _, count = HEADER.unpack_from(self.buffer, offset)
+            # Copied, so no view keeps the buffer from growing
+            return np.frombuffer(self.buffer, np.float32, count * 6, offset + HEADER.size).reshape(count, 6).copy()
+
+    def nearest(self, target, low, high):
+        """The cached frame index in [low, high] closest to `target`, or None."""
+        with self.lock:
+            low, high = max(low, 0), min(high, len(self.offsets) - 1)
+            if high < low:
+                return None
+            found = np.flatnonzero(self.offsets[low:high + 1] >= 0)
+        if len(found) == 0:
+            return None
+        return int(low + found[np.argmin(np.abs(found + low - target))])
+
+    def put(self, index, boxes):
+        boxes = np.asarray(boxes, np.float32).reshape(-1, 6)[:np.iinfo(np.uint16).max]
+        with self.lock:
+            self.index(index, len(self.buffer))
+            self.buffer += HEADER.pack(index, len(boxes)) + boxes.tobytes()
+        if self.evicted:
+            self.flush()
+
+    def flush(self):
+        with self.lock:
+            if self.flushed == len(self.buffer):
+                return
+            with open(self.path, "ab") as f:
+                f.truncate(self.flushed)
+                f.write(self.buffer[self.flushed:])
+            self.flushed = len(self.buffer)
+
+class ResultCache:
+    """Per-frame detection results of video files, so looping or reopened videos skip inference.
+
+    Results are keyed by the video's content digest and a hash of the
+    settings that shape them (model, confidence, input size, crop region), so
+    changing any of those starts a separate log instead of replaying stale
+    boxes. At most `max_logs` logs stay in memory; the least recently used
+    one is flushed and dropped, and reloaded from disk when needed again.
+    """
+
+    def __init__(self, directory="data/results", flush_interval=30, max_logs=8):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self.max_logs = max_logs
+        self.last_flush = time.time()
+        self.logs = collections.OrderedDict()
+        self.lock = threading.Lock()
+
+    def log(self, digest, settings):
+        """The ResultLog for a video digest and a JSON-serializable settings dict."""
+        key = hashlib.sha1(json.dumps(settings, sort_keys=True).encode()).hexdigest()[:12]
+        name = f"{digest[:16]}-{key}"
+        evicted = []
+        with self.lock:
+            if name not in self.logs:
+                self.logs[name] = ResultLog(os.path.join(self.directory, name + ".bin"))
+                while len(self.logs) > self.max_logs:
+                    evicted.append(self.logs.popitem(last=False)[1])
+            self.logs.move_to_end(name)
+            log = self.logs[name]
+        for old in evicted:
+            old.evicted = True
+            old.flush()
+        return log
+
+    def frames(self):
+        with self.lock:
+            return sum(len(log) for log in self.logs.values())
+
+    def maybe_flush(self, now=None):
+        now = time.time() if now is None else now
+        if now - self.last_flush >= self.flush_interval:
+            self.last_flush = now
+            self.flush()
+
+    def flush(self):
+        with self.lock:
+            logs = list(self.logs.values())
+        for log in logs:
+            log.flush()
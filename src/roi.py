@@ -0,0 +1,93 @@
+import cv2
+import numpy as np
+
+class RoiTiler:
+    """Restricts inference to the part of the frame covered by slots.
+
+    The region is the bounding box of all slot points, padded so vehicles
+    whose centre lies near a slot edge are still fully visible. With
+    `tile_size` set, the region is further split into overlapping square
+    tiles of that many source pixels, which the model upsamples to its input
+    size; this helps with small, distant vehicles. Boxes from all crops are
+    mapped back to frame coordinates and de-duplicated with NMS.
+    """
+
+    def __init__(self, slots, frame_shape, tile_size=None, overlap=0.2, padding=0.15, iou_threshold=0.5):
+        self.slots = slots
+        self.shape = tuple(frame_shape[:2])
+        self.tile_size = tile_size
+        self.iou_threshold = iou_threshold
+        height, width = self.shape
+
+        if slots:
+            points = np.array([p for slot in slots for p in slot], np.float64)
+            x0, y0 = points.min(axis=0)
+            x1, y1 = points.max(axis=0)
+            pad_x, pad_y = (x1 - x0) * padding, (y1 - y0) * padding
+            x0, y0 = max(0, int(x0 - pad_x)), max(0, int(y0 - pad_y))
+            x1, y1 = min(width, int(np.ceil(x1 + pad_x))), min(height, int(np.ceil(y1 + pad_y)))
+        else:
+            x0, y0, x1, y1 = 0, 0, width, height
+        self.region = (x0, y0, x1, y1)
+        self.windows = self.make_tiles(overlap) if tile_size else [self.region]
+
+    @classmethod
+    def ensure(cls, tiler, slots, frame_shape, tile_size=None):
+        """Return `tiler` if it still matches the slots, frame size and tile size, otherwise rebuild it."""
+        if (tiler is not None and tiler.slots is slots and tiler.shape == tuple(frame_shape[:2])
+                and tiler.tile_size == tile_size):
+            return tiler
+        return cls(slots, frame_shape, tile_size)
+
+    def make_tiles(self, overlap):
+        x0, y0, x1, y1 = self.region
+        size = self.tile_size
+        step = max(1, int(size * (1 - overlap)))
+
+        def spans(lo, hi):
+            # A slightly oversized tile beats a second tile that is almost all overlap
+            if hi - lo <= size * 1.25:
+                return [(lo, hi)]
+            count = int(np.ceil((hi - lo - size) / step)) + 1
+            return [(int(s), int(s) + size) for s in np.linspace(lo, hi - size, count)]
+
+        return [(xa, ya, xb, yb) for ya, yb in spans(y0, y1) for xa, xb in spans(x0, x1)]
+
+    def crops(self, frame):
+        return [frame[y0:y1, x0:x1] for x0, y0, x1, y1 in self.windows]
+
+    def merge(self, tile_boxes):
+        """Map per-window box arrays (rows of x1, y1, x2, y2, conf, cls) to frame coordinates."""
+        shifted = []
+        for (x0, y0, _, _), boxes in zip(self.windows, tile_boxes):
+            if len(boxes):
+                boxes = boxes.copy()
+                boxes[:, [0, 2]] += x0
+                boxes[:, [1, 3]] += y0
+                shifted.append(boxes)
+        if not shifted:
+            return np.zeros((0, 6), np.float32)
+        boxes = np.concatenate(shifted)
+        if len(self.windows) == 1:
+            return boxes
+
+        # Vehicles cut by a tile border show up in neighbouring tiles too
+        xywh = np.stack([boxes[:, 0], boxes[:, 1], boxes[:, 2] - boxes[:, 0], boxes[:, 3] - boxes[:, 1]], axis=1)
+        keep = cv2.dnn.NMSBoxes(xywh.tolist(), boxes[:, 4].tolist(), 0.0, self.iou_threshold)
+        return boxes[np.array(keep, np.int64).ravel()]
+
+def detect_boxes(model, frames, tilers, **kwargs):
+    """Run `model` on the ROI crops of several frames in one batch.
+
+    Returns one (N, 6) array of x1, y1, x2, y2, conf, cls per frame, in frame coordinates.
+    """
+    crops, owners = [], []
+    for i, (frame, tiler) in enumerate(zip(frames, tilers)):
+        for crop in tiler.crops(frame):
+            crops.append(crop)
+            owners.append(i)
+    per_frame = [[] for _ in frames]
+    if crops:
+        for owner, result in zip(owners, model(crops, **kwargs)):
+            per_frame[owner].append(result.boxes.data.cpu().numpy())
+    return [tiler.merge(boxes) for tiler, boxes in zip(tilers, per_frame)]
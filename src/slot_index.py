@@ -0,0 +1,72 @@
+import cv2
+import numpy as np
+
+class SlotIndex:
+    """Rasterized slot geometry, built once per layout and frame size.
+
+    Every pixel of `labels` holds the 1-based id of the slot covering it (0 for
+    none), so assigning any number of detections to slots is a single NumPy
+    gather instead of one pointPolygonTest per detection and slot. Where slots
+    overlap, the later slot owns the shared pixels.
+    """
+
+    def __init__(self, slots, frame_shape):
+        self.slots = slots
+        self.shape = tuple(frame_shape[:2])
+        self.count = len(slots)
+        if self.count > np.iinfo(np.uint16).max:
+            raise ValueError(f"SlotIndex supports at most 65535 slots, got {self.count}")
+
+        height, width = self.shape
+        self.labels = np.zeros((height, width), np.uint16)
+        for i, slot in enumerate(slots):
+            cv2.fillPoly(self.labels, [np.array(slot, np.int32)], i + 1)
+        self.areas = np.bincount(self.labels.ravel(), minlength=self.count + 1)
+
+    @classmethod
+    def ensure(cls, index, slots, frame_shape):
+        """Return `index` if it still matches the slots and frame size, otherwise rebuild it."""
+        if index is not None and index.slots is slots and index.shape == tuple(frame_shape[:2]):
+            return index
+        return cls(slots, frame_shape)
+
+    def lookup(self, points):
+        """Slot number (0-based) for each (x, y) point, or -1 when it lies outside every slot."""
+        points = np.asarray(points, np.float64).reshape(-1, 2)
+        xs = points[:, 0].astype(np.int64)
+        ys = points[:, 1].astype(np.int64)
+        height, width = self.shape
+        inside = (xs >= 0) & (xs < width) & (ys >= 0) & (ys < height)
+
+        ids = np.zeros(len(points), np.int64)
+        ids[inside] = self.labels[ys[inside], xs[inside]]
+        return ids - 1
+
+    def occupancy(self, boxes, min_overlap=None):
+        """Occupancy list for `boxes` given as rows starting with x1, y1, x2, y2.
+
+        By default a slot is occupied when a box centre falls inside it. With
+        `min_overlap` set, a slot is occupied when the union of all boxes covers
+        at least that fraction of its area.
+        """
+        boxes = np.asarray(boxes, np.float64)
+        boxes = boxes[:, :4] if boxes.ndim == 2 else boxes.reshape(-1, 4)
+        if self.count == 0:
+            return []
+        if len(boxes) == 0:
+            return [False] * self.count
+
+        if min_overlap is None:
+            centers = np.stack([(boxes[:, 0] + boxes[:, 2]) / 2, (boxes[:, 1] + boxes[:, 3]) / 2], axis=1)
+            ids = self.lookup(centers) + 1
+            hits = np.bincount(ids, minlength=self.count + 1)[1:]
+            return (hits > 0).tolist()
+
+        height, width = self.shape
+        clipped = np.clip(np.rint(boxes), 0, [width, height, width, height]).astype(np.int64)
+        covered = np.zeros(self.shape, bool)
+        for x1, y1, x2, y2 in clipped:
+            covered[y1:y2, x1:x2] = True
+        hits = np.bincount(self.labels[covered], minlength=self.count + 1)[1:]
+        ratio = hits / np.maximum(self.areas[1:], 1)
+        return (ratio >= min_overlap).tolist()
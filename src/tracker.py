@@ -0,0 +1,183 @@
+import cv2
+import numpy as np
+
+def box_iou(a, b):
+    """Pairwise IoU between two (N, 4+) and (M, 4+) box arrays."""
+    x1 = np.maximum(a[:, None, 0], b[None, :, 0])
+    y1 = np.maximum(a[:, None, 1], b[None, :, 1])
+    x2 = np.minimum(a[:, None, 2], b[None, :, 2])
+    y2 = np.minimum(a[:, None, 3], b[None, :, 3])
+    inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    return inter / np.maximum(area_a[:, None] + area_b[None, :] - inter, 1e-9)
+
+class BoxTracker:
+    """Carries vehicle boxes forward between full detections.
+
+    `update` takes the boxes of a full detection and matches them to the
+    existing tracks by IoU, so a vehicle keeps its track id from one
+    detection to the next; a track that detections miss survives
+    `max_missed` of them before it is dropped, but only while boxes are
+    propagated between detections: with `detect_every=1` a missed vehicle is
+    gone at once, as in batch analysis. `propagate` moves every box by
+    the median Lucas-Kanade optical flow of feature points inside it, on a
+    downscaled grayscale frame, which costs a few milliseconds instead of a
+    YOLO pass.
+
+    `due` decides when the next full detection is needed: every
+    `detect_every` frames, when too few flow points could be followed, or
+    when motion shows up in a slot no track covers (a vehicle pulling in).
+    """
+
+    def __init__(self, detect_every=1, iou_threshold=0.3, max_missed=2, min_quality=0.5, width=640,
+                 points_per_box=12):
+        self.detect_every = detect_every
+        self.iou_threshold = iou_threshold
+        self.max_missed = max_missed
+        self.min_quality = min_quality
+        self.width = width
+        self.points_per_box = points_per_box
+        self.next_id = 1
+        self.reset()
+
+    def reset(self):
+        """Forget all tracks, e.g. after the source changed."""
+        self.boxes = np.zeros((0, 6), np.float32)
+        self.ids = np.zeros(0, np.int64)
+        self.missed = np.zeros(0, np.int64)
+        self.points = np.zeros((0, 1, 2), np.float32)
+        self.owners = np.zeros(0, np.int64)
+        self.previous = None
+        self.scale = 1.0
+        self.since_detection = 0
+        self.quality = 1.0
+
+    def prepare(self, frame):
+        h, w = frame.shape[:2]
+        self.scale = min(1.0, self.width / w)
+        if self.scale < 1.0:
+            frame = cv2.resize(frame, (self.width, max(1, int(h * self.scale))), interpolation=cv2.INTER_AREA)
+        return cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+
+    def due(self, changed=None, occupancy=None):
+        """True when the next frame needs a full detection instead of propagation.
+
+        `changed` is the per-slot motion mask of the motion gate and
+        `occupancy` the current per-slot state; motion in a vacant slot
+        means something arrived that no track can follow.
+        """
+        if self.previous is None or occupancy is None:
+            return True
+        if self.since_detection + 1 >= self.detect_every or self.quality < self.min_quality:
+            return True
+        if changed is not None and len(changed) == len(occupancy):
+            return bool(np.any(np.asarray(changed, bool) & ~np.asarray(occupancy, bool)))
+        return False
+
+    def update(self, frame, detections):
+        """Adopt the boxes of a full detection (rows of x1, y1, x2, y2, conf, cls); returns the tracked boxes."""
+        detections = np.asarray(detections, np.float32).reshape(-1, 6)
+        ids = np.full(len(detections), -1, np.int64)
+        matched = np.zeros(len(self.boxes), bool)
+        if len(detections) and len(self.boxes):
+            iou = box_iou(self.boxes, detections)
+            # Greedy matching, best overlap first
+            for flat in np.argsort(iou, axis=None)[::-1]:
+                t, d = np.unravel_index(flat, iou.shape)
+                if iou[t, d] < self.iou_threshold:
+                    break
+                if matched[t] or ids[d] >= 0:
+                    continue
+                matched[t] = True
+                ids[d] = self.ids[t]
+
+        fresh = ids < 0
+        ids[fresh] = np.arange(self.next_id, self.next_id + fresh.sum())
+        self.next_id += int(fresh.sum())
+
+        # Missed tracks coast on their propagated box until max_missed detections in a row miss them; without
+        # propagation a coasting box would just stand still, so a vehicle that left would stay "parked"
+        max_missed = self.max_missed if self.detect_every > 1 else 0
+        coasting = ~matched & (self.missed < max_missed)
+        self.boxes = np.concatenate([detections, self.boxes[coasting]])
+        self.ids = np.concatenate([ids, self.ids[coasting]])
+        self.missed = np.concatenate([np.zeros(len(detections), np.int64), self.missed[coasting] + 1])
+
+        if self.detect_every > 1:
+            self.previous = self.prepare(frame)
+            self.pick_points()
+        else:
+            # Every frame is detected, so nothing will be propagated: skip the flow setup
+            self.previous = None
+        self.since_detection = 0
+        self.quality = 1.0
+        return self.boxes
+
+    def pick_points(self):
+        if len(self.boxes) == 0:
+            self.points = np.zeros((0, 1, 2), np.float32)
+            self.owners = np.zeros(0, np.int64)
+            return
+        small = np.rint(self.boxes[:, :4] * self.scale).astype(np.int64)
+        h, w = self.previous.shape
+        small = np.clip(small, 0, [w, h, w, h])
+        mask = np.zeros_like(self.previous)
+        for x1, y1, x2, y2 in small:
+            mask[y1:y2, x1:x2] = 255
+        # One corner search over all boxes is far cheaper than one per box
+        corners = cv2.goodFeaturesToTrack(self.previous, self.points_per_box * len(small), 0.01, 3, mask=mask)
+        corners = np.zeros((0, 2), np.float32) if corners is None else corners.reshape(-1, 2)
+
+        points, owners = [], []
+        for i, (x1, y1, x2, y2) in enumerate(small):
+            inside = corners[(corners[:, 0] >= x1) & (corners[:, 0] < x2) &
+                             (corners[:, 1] >= y1) & (corners[:, 1] < y2)][:self.points_per_box]
+            if len(inside) < 3:
+                # Featureless box (e.g. a plain roof): follow a small grid instead
+                gx, gy = np.meshgrid(np.linspace(x1, x2, 5)[1:-1], np.linspace(y1, y2, 5)[1:-1])
+                inside = np.stack([gx.ravel(), gy.ravel()], axis=1).astype(np.float32)
+            points.append(inside)
+            owners.append(np.full(len(inside), i))
+        self.points = np.concatenate(points).reshape(-1, 1, 2).astype(np.float32)
+        self.owners = np.concatenate(owners)
+
+    def propagate(self, frame):
+        """Move the tracked boxes to `frame` by optical flow; returns the tracked boxes."""
+        gray = self.prepare(frame)
+        self.since_detection += 1
+        if self.previous is None or self.previous.shape != gray.shape:
+            self.previous = None
+            return self.boxes
+        if len(self.points) == 0:
+            self.previous = gray
+            return self.boxes
+
+        moved, status, _ = cv2.calcOpticalFlowPyrLK(self.previous, gray, self.points, None,
+                                                    winSize=(15, 15), maxLevel=2)
+        ok = status.ravel() == 1
+        self.quality = float(ok.mean())
+        shift = (moved - self.points).reshape(-1, 2)
+        for i in range(len(self.boxes)):
+            mine = ok & (self.owners == i)
+            if mine.any():
+                dx, dy = np.median(shift[mine], axis=0) / self.scale
+                self.boxes[i, [0, 2]] += dx
+                self.boxes[i, [1, 3]] += dy
+
+        self.points = moved[ok]
+        self.owners = self.owners[ok]
+        self.previous = gray
+        return self.boxes
+
+    def slot_tracks(self, slot_index):
+        """Track id of the vehicle whose centre lies in each slot, or None."""
+        vehicles = [None] * slot_index.count
+        if len(self.boxes) == 0:
+            return vehicles
+        centers = np.stack([(self.boxes[:, 0] + self.boxes[:, 2]) / 2, (self.boxes[:, 1] + self.boxes[:, 3]) / 2],
+                           axis=1)
+        for slot, track in zip(slot_index.lookup(centers), self.ids):
+            if slot >= 0 and vehicles[slot] is None:
+                vehicles[slot] = int(track)
+        return vehicles
@@ -0,0 +1,128 @@
+import asyncio
+import hashlib
+import os
+import re
+import shutil
+import time
+import uuid
+import cv2
+from src.hashing import remember_digest
+
+# Client-chosen upload ids become file names, so only plain tokens are accepted
+UPLOAD_ID = re.compile(r"[A-Za-z0-9_-]{1,64}")
+# Uploads in progress; their content and hash are not final yet
+INCOMING_DIR = ".incoming"
+VIDEO_EXTENSIONS = {".mp4", ".m4v", ".mov", ".avi", ".mkv", ".webm", ".mpg", ".mpeg", ".wmv", ".ts"}
+
+def is_partial(path):
+    """True for the still-growing file of an upload in progress."""
+    return isinstance(path, str) and os.path.basename(os.path.dirname(path)) == INCOMING_DIR
+
+def can_decode(path):
+    """True once enough of a (possibly still growing) video file exists to decode a frame."""
+    cap = cv2.VideoCapture(path)
+    try:
+        return cap.isOpened() and cap.read()[0]
+    finally:
+        cap.release()
+
+class UploadStore:
+    """Receives video uploads as a stream of chunks into content-addressed storage.
+
+    Chunks are hashed as they arrive and written from a worker thread, so the
+    event loop never blocks on disk I/O. Finished files are stored as
+    `<sha256><ext>`; uploading identical content again keeps the existing file.
+    While the upload is still running, the partial file is probed at growing
+    size thresholds and `on_ready` is called as soon as it can be decoded.
+    """
+
+    def __init__(self, directory="uploads", progressive_bytes=4 << 20, buffer_bytes=1 << 20, keep_records=100):
+        self.directory = directory
+        self.incoming = os.path.join(directory, INCOMING_DIR)
+        self.progressive_bytes = progressive_bytes
+        self.buffer_bytes = buffer_bytes
+        self.keep_records = keep_records
+        self.progress = {}
+        os.makedirs(self.incoming, exist_ok=True)
+
+    def status(self, upload_id):
+        return self.progress.get(upload_id)
+
+    async def receive(self, chunks, filename, upload_id=None, total=None, on_ready=None):
+        """Consume an async iterator of byte chunks; returns the progress record of the finished upload."""
+        if not upload_id or not UPLOAD_ID.fullmatch(upload_id):
+            upload_id = uuid.uuid4().hex
+        ext = os.path.splitext(filename or "")[1].lower()
+        if ext not in VIDEO_EXTENSIONS:
+            ext = ".mp4"
+        part_path = os.path.join(self.incoming, f"{upload_id}{ext}")
+        record = {"id": upload_id, "filename": filename, "received": 0, "total": total,
+                  "state": "receiving", "started": time.time(), "path": None, "duplicate": False,
+                  "progressive": False}
+        self.progress[upload_id] = record
+        # Forget the oldest records (dicts keep insertion order)
+        while len(self.progress) > self.keep_records:
+            self.progress.pop(next(iter(self.progress)))
+
+        digest = hashlib.sha256()
+        next_probe = self.progressive_bytes if on_ready else None
+        pending = []
+        pending_size = 0
+        f = await asyncio.to_thread(open, part_path, "wb")
+        try:
+            async for chunk in chunks:
+                if not chunk:
+                    continue
+                digest.update(chunk)
+                pending.append(chunk)
+                pending_size += len(chunk)
+                record["received"] += len(chunk)
+                if pending_size >= self.buffer_bytes:
+                    await asyncio.to_thread(f.write, b"".join(pending))
+                    pending, pending_size = [], 0
+
+                if next_probe is not None and record["received"] >= next_probe:
+                    if pending:
+                        await asyncio.to_thread(f.write, b"".join(pending))
+                        pending, pending_size = [], 0
+                    await asyncio.to_thread(f.flush)
+                    if await asyncio.to_thread(can_decode, part_path):
+                        record["progressive"] = True
+                        await on_ready(part_path)
+                        next_probe = None
+                    else:
+                        next_probe *= 2
+            if pending:
+                await asyncio.to_thread(f.write, b"".join(pending))
+        except BaseException:
+            record["state"] = "failed"
+            await asyncio.to_thread(f.close)
+            await asyncio.to_thread(self.discard, part_path)
+            raise
+        await asyncio.to_thread(f.close)
+
+        record["sha256"] = digest.hexdigest()
+        final_path = os.path.join(self.directory, record["sha256"] + ext)
+        record["duplicate"] = await asyncio.to_thread(self.commit, part_path, final_path, record["sha256"])
+        record["path"] = final_path
+        record["state"] = "done"
+        return record
+
+    def commit(self, part_path, final_path, sha256):
+        """Move the finished upload into place; returns True if identical content was already stored."""
+        if os.path.exists(final_path):
+            self.discard(part_path)
+            return True
+        try:
+            os.replace(part_path, final_path)
+        except PermissionError:
+            # Windows refuses to rename a file that a progressive reader still holds open
+            shutil.copyfile(part_path, final_path)
+        remember_digest(final_path, sha256)
+        return False
+
+    def discard(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass # Still open elsewhere (Windows); it is overwritten by the next upload with this id
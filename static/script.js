@@ -46,59 +46,204 @@ if (chartCanvas) {
     });
 }
 
-// Update stats every 1 second
+// Latest stats, kept in sync by the /stats/stream push channel
+let currentStats = null;
+
+function renderStats(data) {
+    // Update Metric Cards
+    const capVal = document.getElementById('capacity-val');
+    const occVal = document.getElementById('occupied-val');
+    const avaVal = document.getElementById('available-val');
+    const utiVal = document.getElementById('utilization-val');
+
+    if (capVal) capVal.innerText = data.total;
+    if (occVal) occVal.innerText = data.occupied;
+    if (avaVal) avaVal.innerText = data.vacant;
+    if (utiVal) utiVal.innerText = data.utilization.toFixed(1) + '%';
+
+    // Sync selector if updated from elsewhere
+    const selector = document.getElementById('source-selector');
+    if (selector && selector.value !== data.source) {
+        selector.value = data.source;
+    }
+}
+
+// Minutes since the slot's current stay began, counted locally because stats are pushed only on changes
+function slotDuration(data, index) {
+    const since = data.since && data.since[index];
+    if (!since) return (data.durations && data.durations[index]) || '0m';
+    return Math.max(0, Math.floor((Date.now() / 1000 - since) / 60)) + 'm';
+}
+
+function slotRowHtml(data, index) {
+    const isOccupied = data.slots[index] === true;
+    return `
+        <td>Slot #${(index + 1).toString().padStart(2, '0')}</td>
+        <td><span class="status-badge ${isOccupied ? 'status-occupied' : 'status-vacant'}">${isOccupied ? 'OCCUPIED' : 'VACANT'}</span></td>
+        <td>${slotDuration(data, index)}</td>
+    `;
+}
+
+function refreshDurations() {
+    const logsContainer = document.getElementById('slot-logs');
+    if (!logsContainer || !currentStats || logsContainer.rows.length !== currentStats.slots.length) return;
+    Array.from(logsContainer.rows).forEach((row, index) => {
+        const text = slotDuration(currentStats, index);
+        if (row.cells[2] && row.cells[2].innerText !== text) row.cells[2].innerText = text;
+    });
+}
+
+// Rebuild the slot table; pass changed indices to only touch those rows
+function renderSlotLogs(data, changed) {
+    const logsContainer = document.getElementById('slot-logs');
+    if (!logsContainer) return;
+
+    if (changed && logsContainer.rows.length === data.slots.length) {
+        changed.forEach(index => {
+            logsContainer.rows[index].innerHTML = slotRowHtml(data, index);
+        });
+        return;
+    }
+
+    logsContainer.innerHTML = '';
+    data.slots.forEach((status, index) => {
+        const row = document.createElement('tr');
+        row.innerHTML = slotRowHtml(data, index);
+        logsContainer.appendChild(row);
+    });
+}
+
+// Apply a delta event: slot lists arrive as {index: state}, nested objects recursively
+function applyDelta(target, delta) {
+    Object.entries(delta).forEach(([key, value]) => {
+        if (Array.isArray(target[key]) && value !== null && typeof value === 'object') {
+            Object.entries(value).forEach(([index, state]) => {
+                target[key][Number(index)] = state;
+            });
+        } else if (target[key] !== null && typeof target[key] === 'object' && !Array.isArray(target[key])) {
+            applyDelta(target[key], value);
+        } else {
+            target[key] = value;
+        }
+    });
+}
+
+function pushChartPoint() {
+    if (!occupancyChart || !currentStats) return;
+    const now = new Date().toLocaleTimeString();
+    if (occupancyChart.data.labels.length > 20) {
+        occupancyChart.data.labels.shift();
+        occupancyChart.data.datasets[0].data.shift();
+        occupancyChart.data.datasets[1].data.shift();
+    }
+    occupancyChart.data.labels.push(now);
+    occupancyChart.data.datasets[0].data.push(currentStats.occupied);
+    occupancyChart.data.datasets[1].data.push(currentStats.vacant);
+    occupancyChart.update();
+}
+
+// One-off fetch, used on load when streaming is unavailable and after manual actions
 function updateStats() {
     fetch('/stats')
         .then(response => response.json())
         .then(data => {
-            // Update Metric Cards
-            const capVal = document.getElementById('capacity-val');
-            const occVal = document.getElementById('occupied-val');
-            const avaVal = document.getElementById('available-val');
-            const utiVal = document.getElementById('utilization-val');
-
-            if (capVal) capVal.innerText = data.total;
-            if (occVal) occVal.innerText = data.occupied;
-            if (avaVal) avaVal.innerText = data.vacant;
-            if (utiVal) utiVal.innerText = data.utilization.toFixed(1) + '%';
-
-            // Sync selector if updated from elsewhere
-            const selector = document.getElementById('source-selector');
-            if (selector && selector.value !== data.source) {
-                selector.value = data.source;
-            }
+            currentStats = data;
+            renderStats(data);
+            renderSlotLogs(data);
+        })
+        .catch(err => console.error('Error fetching stats:', err));
+}
 
-            // Update Chart
-            if (occupancyChart) {
-                const now = new Date().toLocaleTimeString();
-                if (occupancyChart.data.labels.length > 20) {
-                    occupancyChart.data.labels.shift();
-                    occupancyChart.data.datasets[0].data.shift();
-                    occupancyChart.data.datasets[1].data.shift();
-                }
-                occupancyChart.data.labels.push(now);
-                occupancyChart.data.datasets[0].data.push(data.occupied);
-                occupancyChart.data.datasets[1].data.push(data.vacant);
-                occupancyChart.update();
-            }
+function subscribeStats() {
+    if (!window.EventSource) {
+        setInterval(updateStats, 1000);
+        updateStats();
+        return;
+    }
 
-            // Update Logs
-            const logsContainer = document.getElementById('slot-logs');
-            if (logsContainer) {
-                logsContainer.innerHTML = '';
-                data.slots.forEach((status, index) => {
+    const source = new EventSource('/stats/stream');
+    source.addEventListener('snapshot', (e) => {
+        currentStats = JSON.parse(e.data);
+        renderStats(currentStats);
+        renderSlotLogs(currentStats);
+    });
+    source.addEventListener('delta', (e) => {
+        if (!currentStats) return;
+        const delta = JSON.parse(e.data);
+        applyDelta(currentStats, delta);
+        renderStats(currentStats);
+        const changed = new Set([...Object.keys(delta.slots || {}), ...Object.keys(delta.since || {})]);
+        renderSlotLogs(currentStats, [...changed].map(Number));
+    });
+    source.onerror = (err) => console.error('Stats stream interrupted, reconnecting:', err);
+}
+
+// Analytics: peak hours and dwell times from the server-side occupancy history
+function formatMinutes(seconds) {
+    return Math.round(seconds / 60) + 'm';
+}
+
+function loadAnalytics() {
+    const end = Date.now() / 1000;
+    const start = end - 7 * 24 * 3600;
+
+    const peakCanvas = document.getElementById('peakHoursChart');
+    if (peakCanvas) {
+        fetch(`/history/downsample?start=${start}&end=${end}&bucket=3600`)
+            .then(response => response.json())
+            .then(points => {
+                // Average the hourly buckets by hour of day
+                const sums = new Array(24).fill(0);
+                const counts = new Array(24).fill(0);
+                points.forEach(p => {
+                    const hour = new Date(p.ts * 1000).getHours();
+                    sums[hour] += p.utilization;
+                    counts[hour] += 1;
+                });
+                new Chart(peakCanvas.getContext('2d'), {
+                    type: 'bar',
+                    data: {
+                        labels: sums.map((_, h) => h.toString().padStart(2, '0') + ':00'),
+                        datasets: [{
+                            label: 'Utilization %',
+                            data: sums.map((s, h) => counts[h] ? +(s / counts[h]).toFixed(1) : 0),
+                            backgroundColor: 'rgba(239, 68, 68, 0.6)'
+                        }]
+                    },
+                    options: {
+                        responsive: true,
+                        maintainAspectRatio: false,
+                        plugins: { legend: { display: false } },
+                        scales: { y: { beginAtZero: true, max: 100 } }
+                    }
+                });
+            })
+            .catch(err => console.error('Error loading peak hours:', err));
+    }
+
+    const dwellLogs = document.getElementById('dwell-logs');
+    if (dwellLogs) {
+        fetch(`/history/dwell?start=${start}&end=${end}`)
+            .then(response => response.json())
+            .then(rows => {
+                dwellLogs.innerHTML = '';
+                rows.forEach(r => {
                     const row = document.createElement('tr');
-                    const isOccupied = status === true;
                     row.innerHTML = `
-                        <td>Slot #${(index + 1).toString().padStart(2, '0')}</td>
-                        <td><span class="status-badge ${isOccupied ? 'status-occupied' : 'status-vacant'}">${isOccupied ? 'OCCUPIED' : 'VACANT'}</span></td>
-                        <td>${data.durations[index] || '0m'}</td>
+                        <td>Cam ${r.camera} / Slot #${(r.slot + 1).toString().padStart(2, '0')}</td>
+                        <td>${r.count}</td>
+                        <td>${formatMinutes(r.mean)}</td>
+                        <td>${formatMinutes(r.max)}</td>
                     `;
-                    logsContainer.appendChild(row);
+                    dwellLogs.appendChild(row);
                 });
-            }
-        })
-        .catch(err => console.error('Error fetching stats:', err));
+            })
+            .catch(err => console.error('Error loading dwell times:', err));
+    }
+}
+
+if (document.getElementById('peakHoursChart') || document.getElementById('dwell-logs')) {
+    loadAnalytics();
 }
 
 // Handle source switch
@@ -221,18 +366,28 @@ if (uploadBtn && fileInput) {
         const file = e.target.files[0];
         if (!file) return;
 
-        const formData = new FormData();
-        formData.append('file', file);
-
         uploadBtn.innerHTML = '<i class="fas fa-spinner fa-spin"></i> Uploading...';
         uploadBtn.classList.add('scanning');
 
-        fetch('/upload_video', {
-            method: 'POST',
-            body: formData
-        })
-        .then(response => response.json())
-        .then(data => {
+        // Stream the raw file so the server can hash it as it arrives and start playback early
+        const xhr = new XMLHttpRequest();
+        xhr.open('POST', '/upload_video');
+        xhr.setRequestHeader('Content-Type', file.type || 'application/octet-stream');
+        xhr.setRequestHeader('X-Filename', encodeURIComponent(file.name));
+        xhr.setRequestHeader('X-Upload-Id', Date.now().toString(36) + Math.random().toString(36).slice(2));
+
+        xhr.upload.onprogress = (event) => {
+            if (event.lengthComputable) {
+                const percent = Math.round(event.loaded / event.total * 100);
+                uploadBtn.innerHTML = `<i class="fas fa-spinner fa-spin"></i> Uploading ${percent}%`;
+            }
+        };
+
+        xhr.onload = () => {
+            if (xhr.status !== 200) {
+                xhr.onerror();
+                return;
+            }
             uploadBtn.innerHTML = '<i class="fas fa-check"></i> Applied';
             uploadBtn.classList.remove('scanning');
             
@@ -245,13 +400,16 @@ if (uploadBtn && fileInput) {
             setTimeout(() => {
                 uploadBtn.innerHTML = '<i class="fas fa-upload"></i> Upload Video';
             }, 3000);
-        })
-        .catch(err => {
-            console.error('Upload error:', err);
+        };
+
+        xhr.onerror = () => {
+            console.error('Upload error:', xhr.status, xhr.responseText);
             uploadBtn.innerHTML = '<i class="fas fa-upload"></i> Upload Video';
             uploadBtn.classList.remove('scanning');
             alert('Video upload failed.');
-        });
+        };
+
+        xhr.send(file);
     });
 }
 
@@ -260,12 +418,14 @@ const saveSettingsBtn = document.getElementById('save-settings-btn');
 if (saveSettingsBtn) {
     saveSettingsBtn.addEventListener('click', () => {
         const sensitivity = document.getElementById('ai-sensitivity').value;
+        const detectEvery = document.getElementById('detect-every').value;
         const darkMode = document.getElementById('dark-mode').checked;
         const notifications = document.getElementById('notifications-toggle').checked;
         const priority = document.getElementById('source-priority').value;
 
         const settingsData = {
             sensitivity: parseFloat(sensitivity) / 100, // Map 10-90 to 0.1-0.9
+            detect_every: parseInt(detectEvery, 10) || 1,
             darkMode: darkMode,
             notifications: notifications,
             sourcePriority: priority
@@ -289,8 +449,10 @@ if (saveSettingsBtn) {
     });
 }
 
-// Auto-run stats update if we are on a page that needs it
+// Subscribe to pushed stats if we are on a page that needs them
 if (document.getElementById('capacity-val') || occupancyChart) {
-    setInterval(updateStats, 1000);
-    updateStats();
+    subscribeStats();
+    // The trend chart keeps sampling once a second between pushes
+    setInterval(pushChartPoint, 1000);
+    setInterval(refreshDurations, 10000);
 }